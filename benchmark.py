@@ -0,0 +1,500 @@
+import matplotlib
+matplotlib.use("Agg")
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as mat_plot
+
+import catalogue
+import intelligence
+import monitoring
+import parallel
+import reporting
+import store
+
+# Sizes of the synthetic data for each mode. Station files always hold one year, as the reporting functions
+# work on a fixed 365-day year, so the amount of data is varied by the number of stations
+benchmark_sizes = {
+    "quick": {
+        "stations": (1, 3),
+        "map_sizes": (50, 100),
+        "map_densities": (0.01, 0.05),
+        "api_days": (1, 7)
+    },
+    "full": {
+        "stations": (1, 10, 50),
+        "map_sizes": (100, 200, 400),
+        "map_densities": (0.01, 0.05, 0.2),
+        "api_days": (1, 30, 365)
+    }
+}
+
+# Reporting functions timed for every station, as (name, function, extra arguments)
+reporting_benchmarks = (
+    ("daily_average", reporting.daily_average, ()),
+    ("daily_median", reporting.daily_median, ()),
+    ("hourly_average", reporting.hourly_average, ()),
+    ("monthly_average", reporting.monthly_average, ()),
+    ("count_missing_data", reporting.count_missing_data, ()),
+    ("rolling_average", reporting.rolling_average, (24,)),
+    ("summary_statistics", reporting.summary_statistics, ()),
+    ("period_percentiles", reporting.period_percentiles, (98, "month")),
+    ("backtest_warnings", reporting.backtest_warnings, ())
+)
+
+default_results_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "benchmark-results.jsonl")
+
+
+def run_benchmarks(mode="quick", repeat=3, seed=0):
+    """Generates synthetic data and times every reporting aggregation, intelligence stage and monitoring
+    parse/export path against it. Runs in a temporary folder, so nothing is written to the data folder
+
+    Parameters:
+    mode (str): 'quick' or 'full', selects the sizes from benchmark_sizes, default is 'quick'
+    repeat (int): How many times each function is timed, default is 3
+    seed (int): Seed for the synthetic data so runs are reproducible, default is 0
+
+    Returns:
+    results (list): Contains a dict of the name, parameters and timings of every benchmark"""
+
+    sizes = benchmark_sizes[mode]
+    results = []
+    working_directory = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as folder:
+        # The modules read and write relative to the data folder, station files relative to the station folder
+        os.chdir(folder)
+        os.makedirs("data")
+        catalogue.set_station_folder(folder)
+
+        try:
+            results += benchmark_reporting(sizes, repeat, seed)
+            results += benchmark_intelligence(sizes, repeat, seed)
+            results += benchmark_monitoring(sizes, repeat, seed)
+        finally:
+            monitoring.set_data_source()
+            monitoring.load_archive_values.cache_clear()
+            catalogue.set_station_folder()
+            os.chdir(working_directory)
+
+    return results
+
+
+def save_results(results, mode, file_name=default_results_file):
+    """Appends a run of benchmark results to a JSON lines file, along with the version of the code
+
+    Parameters:
+    results (list): The results from run_benchmarks
+    mode (str): The mode the benchmarks were run in
+    file_name (str): The file being appended to, default is data/benchmark-results.jsonl"""
+
+    run = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "revision": get_revision(),
+        "mode": mode,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "results": results
+    }
+
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, 'a') as f:
+        f.write(json.dumps(run) + "\n")
+
+
+def compare_results(file_name=default_results_file, tolerance=0.1):
+    """Compares the last two runs in a results file in the same mode, listing benchmarks which got slower
+
+    Parameters:
+    file_name (str): The results file, default is data/benchmark-results.jsonl
+    tolerance (float): How much slower (as a fraction) a benchmark must be to count as a regression, default is 0.1
+
+    Returns:
+    report (str): A table of every benchmark in both runs, with regressions marked"""
+
+    with open(file_name) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+
+    if not runs:
+        return "\n No benchmark runs to compare."
+
+    latest = runs[-1]
+    previous = [run for run in runs[:-1] if run["mode"] == latest["mode"]]
+    if not previous:
+        return "\n Only one benchmark run in this mode, nothing to compare."
+    previous = previous[-1]
+
+    previous_timings = {get_result_key(result): result["best"] for result in previous["results"]}
+
+    report = (f"\n Comparing {latest['revision']} ({latest['time']}) against "
+              f"{previous['revision']} ({previous['time']})\n\n")
+    report += f" {'Benchmark':70} {'Before (s)':>11} {'After (s)':>11} {'Change':>8}\n"
+
+    for result in latest["results"]:
+        key = get_result_key(result)
+        if key not in previous_timings:
+            continue
+
+        before = previous_timings[key]
+        after = result["best"]
+        change = (after - before) / before if before else 0
+        marker = "  REGRESSION" if change > tolerance else ""
+        report += f" {key:70} {before:11.4f} {after:11.4f} {change:+8.1%}{marker}\n"
+
+    return report
+
+
+# Data generators
+
+def generate_station_csv(file_name, missing_fraction=0.02, seed=0):
+    """Writes a synthetic station CSV file of one 365-day year in the same format as the data folder, starting at
+    2021-01-01
+
+    Parameters:
+    file_name (str): The file being written
+    missing_fraction (float): The fraction of entries which are "No data", default is 0.02
+    seed (int): Seed for the random values, default is 0"""
+
+    random_generator = np.random.default_rng(seed)
+    number_of_hours = 365 * 24
+
+    hours = np.arange(number_of_hours)
+    dates = (np.datetime64("2021-01-01") + hours // 24).astype(str)
+    times = np.char.add(np.char.zfill((hours % 24 + 1).astype(str), 2), ":00:00")
+
+    # A daily cycle plus noise, so the values look like pollution readings
+    daily_cycle = 1 + 0.5 * np.sin(2 * np.pi * (hours % 24) / 24)
+    columns = {}
+    for pollutant, scale in (("no", 20), ("pm10", 18), ("pm25", 10)):
+        values = np.round(scale * daily_cycle * random_generator.lognormal(0, 0.5, number_of_hours), 3)
+        values = values.astype(str)
+        values[random_generator.random(number_of_hours) < missing_fraction] = "No data"
+        columns[pollutant] = values
+
+    df = pd.DataFrame({"date": dates, "time": times, **columns})
+    df.to_csv(file_name, index=False)
+
+
+def generate_map(file_name, size=100, density=0.05, seed=0):
+    """Writes a synthetic map PNG of red and cyan blobs on a white background
+
+    Parameters:
+    file_name (str): The file being written
+    size (int): The width and height in pixels, default is 100
+    density (float): The fraction of pixels which are red or cyan, default is 0.05
+    seed (int): Seed for the positions of the blobs, default is 0"""
+
+    random_generator = np.random.default_rng(seed)
+    image = np.ones((size, size, 3))
+
+    # Blobs of 3x3 pixels, alternating red and cyan
+    number_of_blobs = int(size * size * density / 9)
+    for blob in range(number_of_blobs):
+        y, x = random_generator.integers(0, size - 3, 2)
+        image[y:y + 3, x:x + 3] = (1, 0, 0) if blob % 2 == 0 else (0, 1, 1)
+
+    mat_plot.imsave(file_name, image)
+
+
+def generate_api_payloads(folder, days=1, seed=0):
+    """Writes synthetic API responses for every station and pollutant in the catalogue as monitoring recordings,
+    covering the days from 2021-01-01
+
+    Parameters:
+    folder (str): The recordings folder
+    days (int): The number of days each response covers, default is 1
+    seed (int): Seed for the random values, default is 0
+
+    Returns:
+    start_date (datetime.date): The first day of the responses
+    end_date (datetime.date): The day after the last day of the responses"""
+
+    random_generator = np.random.default_rng(seed)
+    start_date = datetime.date(2021, 1, 1)
+    end_date = start_date + datetime.timedelta(days=days)
+    start_time = datetime.datetime.combine(start_date, datetime.time())
+
+    os.makedirs(folder, exist_ok=True)
+    for site_code in (catalogue.get_station(name)["code"] for name in catalogue.station_names()):
+        for species_code in (catalogue.get_pollutant(name)["code"] for name in catalogue.pollutant_names()):
+
+            values = np.round(random_generator.lognormal(2.5, 0.5, days * 24), 1)
+            readings = [{"@MeasurementDateGMT": (start_time + datetime.timedelta(hours=hour)).strftime(
+                             '%Y-%m-%d %H:%M:%S'),
+                         "@Value": "" if value > 40 else str(value)}
+                        for hour, value in enumerate(values)]
+
+            data = {"RawAQData": {"@SiteCode": site_code, "@SpeciesCode": species_code, "Data": readings}}
+            recording_name = f"SiteSpecies {site_code} {species_code} {start_date} {end_date}.json"
+            with open(os.path.join(folder, recording_name), 'w') as f:
+                json.dump(data, f)
+
+    return start_date, end_date
+
+
+# Benchmarks
+
+def benchmark_reporting(sizes, repeat, seed):
+    """Times loading the station CSVs and every reporting aggregation for each number of stations
+
+    Parameters:
+    sizes (dict): The sizes from benchmark_sizes
+    repeat (int): How many times each function is timed
+    seed (int): Seed for the synthetic data
+
+    Returns:
+    results (list): The results of every benchmark"""
+
+    results = []
+
+    for number_of_stations in sizes["stations"]:
+
+        file_names = []
+        for station in range(number_of_stations):
+            file_name = f"data/Pollution-London Station {station}.csv"
+            if not os.path.exists(file_name):
+                generate_station_csv(file_name, seed=seed + station)
+            file_names.append(file_name)
+
+        parameters = {"stations": number_of_stations}
+
+        def load_stations():
+            return {file_name: reporting.load_station_data(file_name) for file_name in file_names}
+
+        results.append(time_function("reporting.load_station_data", parameters, repeat, load_stations))
+
+        def load_station_stores():
+            return {file_name: store.load_station_store(file_name) for file_name in file_names}
+
+        results.append(time_function("store.load_station_store", parameters, repeat, load_station_stores))
+        data = load_stations()
+
+        for name, function, arguments in reporting_benchmarks:
+            def run_for_every_station():
+                for station in data:
+                    function(data, station, "pm25", *arguments)
+
+            results.append(time_function(f"reporting.{name}", parameters, repeat, run_for_every_station))
+
+        def fill_every_station():
+            # Filling changes the data, so each run fills a fresh copy
+            copied_data = {station: df.copy() for station, df in data.items()}
+            for station in copied_data:
+                reporting.fill_missing_data(copied_data, 0, station, "pm25")
+
+        results.append(time_function("reporting.fill_missing_data", parameters, repeat, fill_every_station))
+
+        for backend in ("serial", "process"):
+            results.append(time_function(f"parallel.parallel_aggregate {backend}", parameters, repeat,
+                                         parallel.parallel_aggregate, data, "daily", None, ["pm25"], 30,
+                                         None, backend))
+
+    return results
+
+
+def benchmark_intelligence(sizes, repeat, seed):
+    """Times every stage of the intelligence module for each map size and density
+
+    Parameters:
+    sizes (dict): The sizes from benchmark_sizes
+    repeat (int): How many times each function is timed
+    seed (int): Seed for the synthetic maps
+
+    Returns:
+    results (list): The results of every benchmark"""
+
+    results = []
+
+    for size in sizes["map_sizes"]:
+        for density in sizes["map_densities"]:
+
+            file_name = f"data/map-{size}-{density}.png"
+            generate_map(file_name, size, density, seed)
+            parameters = {"size": size, "density": density}
+
+            results.append(time_function("intelligence.find_red_pixels", parameters, repeat,
+                                         intelligence.find_red_pixels, file_name))
+            results.append(time_function("intelligence.find_cyan_pixels", parameters, repeat,
+                                         intelligence.find_cyan_pixels, file_name))
+
+            red_map = intelligence.find_red_pixels(file_name)
+            results.append(time_function("intelligence.detect_connected_components", parameters, repeat,
+                                         intelligence.detect_connected_components, red_map))
+
+            # detect_connected_components_sorted changes the array it is passed
+            mark = quietly(intelligence.detect_connected_components, red_map)
+            results.append(time_function("intelligence.detect_connected_components_sorted", parameters, repeat,
+                                         lambda: intelligence.detect_connected_components_sorted(mark.copy())))
+
+            index = intelligence.build_component_index(mark)
+            results.append(time_function("intelligence.build_component_index", parameters, repeat,
+                                         intelligence.build_component_index, mark))
+            results.append(time_function("intelligence.query_region", parameters, repeat,
+                                         intelligence.query_region, index, 0, 0, size // 4, size // 4))
+            results.append(time_function("intelligence.nearest_components", parameters, repeat,
+                                         intelligence.nearest_components, index, size / 2, size / 2, 3))
+
+    return results
+
+
+def benchmark_monitoring(sizes, repeat, seed):
+    """Times parsing, graphing and exporting recorded API responses for each number of days
+
+    Parameters:
+    sizes (dict): The sizes from benchmark_sizes
+    repeat (int): How many times each function is timed
+    seed (int): Seed for the synthetic responses
+
+    Returns:
+    results (list): The results of every benchmark"""
+
+    results = []
+
+    for days in sizes["api_days"]:
+        folder = f"data/recordings-{days}"
+        start_date, end_date = generate_api_payloads(folder, days, seed)
+        monitoring.set_data_source("recorded", recordings_folder=folder)
+
+        parameters = {"days": days}
+        raw_data = monitoring.get_live_data_from_api("MY1", "PM10", start_date, end_date)
+        data = monitoring.extract_data(raw_data)
+        values = np.array([value if value else np.nan for value in data], dtype=float)
+
+        results.append(time_function("monitoring.get_live_data_from_api", parameters, repeat,
+                                     monitoring.get_live_data_from_api, "MY1", "PM10", start_date, end_date))
+        results.append(time_function("monitoring.extract_data", parameters, repeat,
+                                     monitoring.extract_data, raw_data))
+        results.append(time_function("monitoring.extract_new_readings", parameters, repeat,
+                                     monitoring.extract_new_readings, raw_data))
+        results.append(time_function("monitoring.generate_graph", parameters, repeat,
+                                     monitoring.generate_graph, data[:24]))
+        results.append(time_function("monitoring.render_graphs", parameters, repeat,
+                                     monitoring.render_graphs, [values, values, values]))
+        results.append(time_function("monitoring.export_data", parameters, repeat,
+                                     monitoring.export_data, "Marylebone Road", "pm10",
+                                     str(start_date), str(end_date)))
+
+        # Every station and pollutant into one file
+        pairs = [(station, pollutant) for station in catalogue.station_names()
+                 for pollutant in catalogue.pollutant_names()]
+        for file_format in ("csv.gz", "npz"):
+            results.append(time_function(f"monitoring.export_series {file_format}", parameters, repeat,
+                                         monitoring.export_series, pairs, str(start_date), str(end_date),
+                                         f"data/export{monitoring.export_formats[file_format]}"))
+
+    # Replaying synthetic CSV files under the real station names
+    for station in catalogue.station_names():
+        generate_station_csv(catalogue.station_file(station), seed=seed)
+    monitoring.load_archive_values.cache_clear()
+
+    monitoring.set_data_source("csv")
+    results.append(time_function("monitoring.pollutants_warning", {"source": "csv"}, repeat,
+                                 monitoring.pollutants_warning))
+
+    return results
+
+
+# My functions
+
+def time_function(name, parameters, repeat, function, *args):
+    """Times a function several times, hiding anything it prints
+
+    Parameters:
+    name (str): The name of the benchmark
+    parameters (dict): The sizes the benchmark was run with
+    repeat (int): How many times the function is timed
+    function (function): The function being timed
+    args: Passed on to the function
+
+    Returns:
+    result (dict): Contains the name, parameters and the best and mean time in seconds"""
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        quietly(function, *args)
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        "name": name,
+        "parameters": parameters,
+        "best": min(timings),
+        "mean": sum(timings) / len(timings),
+        "repeat": repeat
+    }
+
+    return result
+
+
+def quietly(function, *args):
+    """Calls a function with anything it prints hidden
+
+    Parameters:
+    function (function): The function being called
+    args: Passed on to the function
+
+    Returns:
+    output: Whatever the function returns"""
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = function(*args)
+
+    return output
+
+
+def get_result_key(result):
+    """Builds a name for a benchmark result which includes its parameters, used to match results between runs
+
+    Parameters:
+    result (dict): A benchmark result
+
+    Returns:
+    key (str): e.g. 'reporting.daily_average stations=3'"""
+
+    key = result["name"] + "".join(f" {name}={value}" for name, value in result["parameters"].items())
+    return key
+
+
+def get_revision():
+    """Finds the git revision of the code being benchmarked
+
+    Returns:
+    revision (str): The short commit hash, or 'unknown' outside a git repository"""
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                  check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = "unknown"
+
+    return revision
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks the reporting, intelligence and monitoring modules")
+    parser.add_argument("--mode", choices=benchmark_sizes.keys(), default="quick")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=default_results_file)
+    parser.add_argument("--compare", action="store_true", help="only compare the last two saved runs")
+    arguments = parser.parse_args()
+
+    if not arguments.compare:
+        benchmark_results = run_benchmarks(arguments.mode, arguments.repeat, arguments.seed)
+        save_results(benchmark_results, arguments.mode, arguments.output)
+        for benchmark_result in benchmark_results:
+            print(f" {get_result_key(benchmark_result):70} {benchmark_result['best']:10.4f}s")
+
+    print(compare_results(arguments.output))
@@ -0,0 +1,157 @@
+import os
+import json
+from functools import lru_cache
+
+# The folder of this module, which the catalogue and its station files are found relative to, so nothing
+# depends on the working directory
+module_folder = os.path.dirname(os.path.abspath(__file__))
+
+# Lists every station and pollutant, adding a station only needs an entry here and its CSV file. It's read on
+# first use
+catalogue_file = os.path.join(module_folder, "data", "catalogue.json")
+
+# The folder the catalogue's station files are relative to, changed with set_station_folder
+station_folder = {
+    "folder": module_folder
+}
+
+
+@lru_cache(maxsize=None)
+def load_catalogue(file_name=catalogue_file):
+    """Reads the station and pollutant catalogue, only once per file
+
+    Parameters:
+    file_name (str): The catalogue file, default is catalogue.json in the data folder next to this module
+
+    Returns:
+    catalogue (dict): Contains the stations and pollutants as tuples in the catalogue's order,
+                      along with lookups from names and codes to their position"""
+
+    with open(file_name) as f:
+        raw_catalogue = json.load(f)
+
+    stations = tuple(raw_catalogue["stations"])
+    pollutants = tuple(raw_catalogue["pollutants"])
+
+    catalogue = {
+        "stations": stations,
+        "pollutants": pollutants,
+        "station_indexes": {station["name"]: index for index, station in enumerate(stations)},
+        "pollutant_indexes": {pollutant["name"]: index for index, pollutant in enumerate(pollutants)},
+        "station_code_indexes": {station["code"]: index for index, station in enumerate(stations)},
+        "pollutant_code_indexes": {pollutant["code"]: index for index, pollutant in enumerate(pollutants)}
+    }
+
+    return catalogue
+
+
+def station_names():
+    """Returns the names of every station, e.g. 'Harlington'
+
+    Returns:
+    names (tuple): The station names in the catalogue's order"""
+
+    names = tuple(station["name"] for station in load_catalogue()["stations"])
+    return names
+
+
+def pollutant_names():
+    """Returns the names of every pollutant, which are also their CSV column names, e.g. 'pm10'
+
+    Returns:
+    names (tuple): The pollutant names in the catalogue's order"""
+
+    names = tuple(pollutant["name"] for pollutant in load_catalogue()["pollutants"])
+    return names
+
+
+def get_station(name):
+    """Returns everything the catalogue holds about a station
+
+    Parameters:
+    name (str): The name of the station, e.g. 'Harlington'
+
+    Returns:
+    station (dict): Contains the station's name, description, API code and CSV file"""
+
+    catalogue = load_catalogue()
+    station = catalogue["stations"][catalogue["station_indexes"][name]]
+    return station
+
+
+def get_pollutant(name):
+    """Returns everything the catalogue holds about a pollutant
+
+    Parameters:
+    name (str): The name of the pollutant, e.g. 'pm10'
+
+    Returns:
+    pollutant (dict): Contains the pollutant's name, API code, warning bands and descriptions"""
+
+    catalogue = load_catalogue()
+    pollutant = catalogue["pollutants"][catalogue["pollutant_indexes"][name]]
+    return pollutant
+
+
+@lru_cache(maxsize=None)
+def get_codes():
+    """Maps the name of every station and pollutant to its API code, e.g. 'Harlington' to 'LH0'
+
+    Returns:
+    codes (dict): The API code of every station and pollutant"""
+
+    catalogue = load_catalogue()
+    codes = {entry["name"]: entry["code"] for entry in catalogue["stations"] + catalogue["pollutants"]}
+    return codes
+
+
+def get_name(code):
+    """Converts an API code back to the name of its station or pollutant, e.g. 'LH0' to 'Harlington'
+
+    Parameters:
+    code (str): The API code
+
+    Returns:
+    name (str): The name of the station or pollutant"""
+
+    catalogue = load_catalogue()
+
+    if code in catalogue["station_code_indexes"]:
+        return catalogue["stations"][catalogue["station_code_indexes"][code]]["name"]
+
+    name = catalogue["pollutants"][catalogue["pollutant_code_indexes"][code]]["name"]
+    return name
+
+
+def station_file(name):
+    """Returns the CSV file of a station
+
+    Parameters:
+    name (str): The name of the station, e.g. 'Harlington'
+
+    Returns:
+    file_name (str): The station's CSV file, relative to the station folder"""
+
+    file_name = os.path.join(station_folder["folder"], get_station(name)["file"])
+    return file_name
+
+
+def set_station_folder(folder=None):
+    """Changes the folder the station files are found in, e.g. to use synthetic data instead
+
+    Parameters:
+    folder (str): The folder holding a data folder of station files, default is None for this module's folder"""
+
+    station_folder["folder"] = module_folder if folder is None else os.path.abspath(folder)
+
+
+@lru_cache(maxsize=None)
+def get_warning_bands():
+    """Returns the warning bands of every pollutant, keyed by API code
+
+    Returns:
+    warning_bands (dict): (threshold, level) pairs in ascending order of threshold for every pollutant"""
+
+    warning_bands = {pollutant["code"]: tuple(tuple(band) for band in pollutant["warning_bands"])
+                     for pollutant in load_catalogue()["pollutants"]}
+    return warning_bands
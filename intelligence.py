@@ -1,8 +1,16 @@
 import numpy as np
 from matplotlib import pyplot as mat_plot
-from math import floor
+import profiling
+import threading
+import time
+import sys
 
 
+class JobCancelled(Exception):
+    """Raised by a long-running job when its cancel token is set"""
+
+
+@profiling.profiled
 def find_red_pixels(map_filename, upper_threshold=100, lower_threshold=50):
     """Searches a .png file row by row for red pixels, identifying if they are above or below certain RGB values
 
@@ -22,6 +30,7 @@ def find_red_pixels(map_filename, upper_threshold=100, lower_threshold=50):
     # Unpacking sizes of the colour map and creating 2D output array
     height, width, *_ = colour_map.shape
     output_map = np.zeros((height, width))
+    profiling.add_count("pixels", height * width)
 
     # Iterates through each pixel of colour map
     for row_number, row in enumerate(colour_map):
@@ -45,6 +54,7 @@ def find_red_pixels(map_filename, upper_threshold=100, lower_threshold=50):
     return output_map
 
 
+@profiling.profiled
 def find_cyan_pixels(map_filename, upper_threshold=100, lower_threshold=50):
     """Searches a .png file row by row for cyan pixels, identifying if they are above or below certain RGB values
 
@@ -63,7 +73,8 @@ def find_cyan_pixels(map_filename, upper_threshold=100, lower_threshold=50):
 
     # Unpacking sizes of the colour map and creating 2D output array
     height, width, *_ = colour_map.shape
-    output_map = np.empty((height, width))
+    output_map = np.zeros((height, width))
+    profiling.add_count("pixels", height * width)
 
     # Iterates through each pixel of colour map
     for row_number, row in enumerate(colour_map):
@@ -87,33 +98,48 @@ def find_cyan_pixels(map_filename, upper_threshold=100, lower_threshold=50):
     return output_map
 
 
-def detect_connected_components(IMG):
+@profiling.profiled
+def detect_connected_components(IMG, progress=None, cancel=None, verbose=True, return_index=False, cell_size=32):
     """Searches a .png file row by row for connected components (assuming 8-adjacency), then printing them and
     writing to a file 'cc-output-2a.txt'
 
     Parameters:
     IMG (np.ndarray): A 2D numpy array representing a binary colour map where 1's indicate a pixel of interest
+    progress (function): Called after every row with a dict of the rows and pixels processed, throughput and ETA,
+                         default is None to print every 10% when verbose
+    cancel (threading.Event): Stops the search by raising JobCancelled once set, default is None
+    verbose (bool): Prints the progress and components, default is True
+    return_index (bool): Also returns a spatial index of the components, built while labelling, default is False
+    cell_size (int): The size in pixels of the spatial index's grid cells, default is 32
 
     Returns:
     MARK (np.ndarray): A 2D numpy array where each pixel has its own components code assigned or a 0 if it's
-                       not a pixel of interest"""
+                       not a pixel of interest
+    index (dict): The spatial index from create_spatial_index, only if return_index is True"""
 
     height, width, *_ = IMG.shape
     MARK = np.zeros((height, width))
+    profiling.add_count("pixels", height * width)
     number_of_components = 0
 
-    print("")  # Formatting reasons
+    # The bounds, pixel count and coordinate sums of every component, only kept for the spatial index
+    component_bounds = {} if return_index else None
+
+    if verbose:
+        print("")  # Formatting reasons
+
     # Used to give progress updates to user
-    ten_percent_value = floor(height / 10)
+    if progress is None and verbose:
+        progress = print_progress
+    start_time = time.monotonic()
 
     # Creating queue
     Q = np.ndarray((0, 2))
 
     for y, row in enumerate(IMG):
 
-        # Gives progress updates to user
-        if y % ten_percent_value == 0:
-            print(f" {((y // ten_percent_value)+1) * 10}%")
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled(f"Cancelled after {y} of {height} rows")
 
         for x, pixel in enumerate(row):
 
@@ -123,37 +149,174 @@ def detect_connected_components(IMG):
                 MARK[y, x] = number_of_components
                 Q = np.append(Q, [(y, x)], axis=0)
 
+                if component_bounds is not None:
+                    component_bounds[number_of_components] = [y, x, y, x, 1, y, x]
+
                 while len(Q) != 0:
                     deleted_item = [int(Q[0][0]), int(Q[0][1])]
                     Q = np.delete(Q, 0, axis=0)
 
                     # For each 8-neighbour
-                    for y in range(-1, 2):
-                        for x in range(-1, 2):
-                            new_x = deleted_item[0] + y
-                            new_y = deleted_item[1] + x
+                    # (offsets have their own names so the row and column being scanned aren't overwritten)
+                    for y_offset in range(-1, 2):
+                        for x_offset in range(-1, 2):
+                            new_x = deleted_item[0] + y_offset
+                            new_y = deleted_item[1] + x_offset
+
+                            # Negative indexes would wrap around to the other side of the image
+                            if new_x < 0 or new_y < 0:
+                                continue
 
                             try:
                                 if IMG[new_x, new_y] and not MARK[new_x, new_y]:
                                     # Used to track the pavement pixels
                                     MARK[new_x, new_y] = number_of_components
                                     Q = np.append(Q, [(new_x, new_y)], axis=0)
+
+                                    if component_bounds is not None:
+                                        add_component_pixel(component_bounds[number_of_components], new_x,
+                                                            new_y)
                             except IndexError:
                                 _ = _
 
+        # Gives progress updates to user
+        if progress is not None:
+            progress(get_progress(y + 1, height, width, number_of_components, start_time))
+
     connected_components = convert_to_dict(MARK)
     with open("data/cc-output-2a.txt", "w") as file:
         for key in connected_components:
             file.writelines(f"Connected Component {int(key)}, number of pixels = {connected_components[key]}\n")
         file.writelines(f"Total number of connected components = {len(connected_components)}")
 
-    print("")
-    for key in connected_components:
-        print(f" Connected Component {int(key)}, number of pixels = {connected_components[key]}")
+    if verbose:
+        print_components(connected_components)
+
+    if return_index:
+        return MARK, create_spatial_index(component_bounds, cell_size)
 
     return MARK
 
 
+@profiling.profiled
+def build_component_index(MARK, cell_size=32):
+    """Builds the spatial index of components which have already been labelled, e.g. a MARK array from an
+    earlier run, in one vectorised pass
+
+    Parameters:
+    MARK (np.ndarray): A 2D numpy array where each pixel has its own components code assigned or a 0 if it's
+                       not a pixel of interest
+    cell_size (int): The size in pixels of the grid cells, default is 32
+
+    Returns:
+    index (dict): The spatial index from create_spatial_index"""
+
+    rows, columns = np.nonzero(MARK)
+    labels = MARK[rows, columns].astype(np.int64)
+    profiling.add_count("pixels", MARK.size)
+
+    component_bounds = {}
+    if len(labels):
+        # Every reduction is grouped by label at once
+        size = labels.max() + 1
+        counts = np.bincount(labels, minlength=size)
+        row_sums = np.bincount(labels, rows, minlength=size)
+        column_sums = np.bincount(labels, columns, minlength=size)
+
+        min_rows = np.full(size, MARK.shape[0])
+        min_columns = np.full(size, MARK.shape[1])
+        max_rows = np.full(size, -1)
+        max_columns = np.full(size, -1)
+        np.minimum.at(min_rows, labels, rows)
+        np.minimum.at(min_columns, labels, columns)
+        np.maximum.at(max_rows, labels, rows)
+        np.maximum.at(max_columns, labels, columns)
+
+        for label in np.flatnonzero(counts).tolist():
+            component_bounds[label] = [int(min_rows[label]), int(min_columns[label]), int(max_rows[label]),
+                                       int(max_columns[label]), int(counts[label]), float(row_sums[label]),
+                                       float(column_sums[label])]
+
+    index = create_spatial_index(component_bounds, cell_size)
+    return index
+
+
+def query_region(index, top, left, bottom, right):
+    """Finds the components whose bounding boxes overlap a region, only checking those in the grid cells it
+    covers
+
+    Parameters:
+    index (dict): The spatial index from detect_connected_components or build_component_index
+    top (int): The first row of the region
+    left (int): The first column of the region
+    bottom (int): The last row of the region, included
+    right (int): The last column of the region, included
+
+    Returns:
+    labels (list): The component codes, in ascending order"""
+
+    cell_size = index["cell_size"]
+    candidates = set()
+
+    for cell_row in range(max(0, top // cell_size), bottom // cell_size + 1):
+        for cell_column in range(max(0, left // cell_size), right // cell_size + 1):
+            candidates.update(index["grid"].get((cell_row, cell_column), ()))
+
+    labels = []
+    for label in candidates:
+        min_row, min_column, max_row, max_column = index["components"][label]["bbox"]
+        if min_row <= bottom and max_row >= top and min_column <= right and max_column >= left:
+            labels.append(label)
+
+    labels.sort()
+    return labels
+
+
+def nearest_components(index, row, column, count=1):
+    """Finds the components closest to a point, e.g. a monitoring station, searching the grid cells in rings
+    outwards from it until no closer component could be found
+
+    Parameters:
+    index (dict): The spatial index from detect_connected_components or build_component_index
+    row (float): The row of the point
+    column (float): The column of the point
+    count (int): The number of components found, default is 1
+
+    Returns:
+    nearest (list): (component code, distance) tuples, nearest first. The distance is to the component's
+                    bounding box, 0 if the point is inside it, with ties going to the closer centroid"""
+
+    cell_size = index["cell_size"]
+    grid_rows, grid_columns = index["grid_shape"]
+    point_row, point_column = int(row // cell_size), int(column // cell_size)
+
+    # A point outside the grid starts at the first ring reaching it, and the last ring reaches its far corner,
+    # so the number of rings searched depends on the size of the grid rather than how far away the point is
+    row_gap = max(-point_row, point_row - grid_rows + 1, 0)
+    column_gap = max(-point_column, point_column - grid_columns + 1, 0)
+    first_ring = max(row_gap, column_gap)
+    last_ring = max(abs(point_row), abs(point_row - grid_rows + 1), abs(point_column),
+                    abs(point_column - grid_columns + 1)) if index["grid"] else -1
+
+    checked = set()
+    found = []
+    for ring in range(first_ring, last_ring + 1):
+        # Cells in this ring and further out are at least (ring - 1) cells away from the point
+        if len(found) >= count and (ring - 1) * cell_size > sorted(found)[count - 1][0]:
+            break
+
+        for cell in get_ring_cells(point_row, point_column, ring, index["grid_shape"]):
+            for label in index["grid"].get(cell, ()):
+                if label in checked:
+                    continue
+                checked.add(label)
+                found.append((*get_component_distance(index["components"][label], row, column), label))
+
+    nearest = [(label, distance) for distance, _, label in sorted(found)[:count]]
+    return nearest
+
+
+@profiling.profiled
 def detect_connected_components_sorted(MARK):
     """Searches a .png file row by row for connected components (assuming 8-adjacency), then printing them sorted and
         writing to a file 'cc-output-2a.txt'. It also presents the two largest components in a binary colour map.
@@ -163,6 +326,7 @@ def detect_connected_components_sorted(MARK):
                            not a pixel of interest"""
 
     components_unsorted = convert_to_dict(MARK)
+    profiling.add_count("pixels", MARK.size)
     components_array = []
 
     for key in components_unsorted:
@@ -183,10 +347,11 @@ def detect_connected_components_sorted(MARK):
               f"{components_sorted[index][0]}")
 
     # Displaying two largest components in binary colour map
+    largest_labels = [component[1] for component in components_sorted[:2]]
     two_largest_components = MARK
     for row_number, row in enumerate(two_largest_components):
         for column_number, element in enumerate(row):
-            if element == 129 or element == 109:
+            if element in largest_labels:
                 two_largest_components[row_number][column_number] = 1
             else:
                 two_largest_components[row_number][column_number] = 0
@@ -195,8 +360,141 @@ def detect_connected_components_sorted(MARK):
     mat_plot.show()
 
 
+def start_job(function, *args, **kwargs):
+    """Runs a long-running function, e.g. detect_connected_components, on a background thread. The function
+    must take progress and cancel arguments
+
+    Parameters:
+    function (function): The function being run
+    args: Passed on to the function
+    kwargs: Passed on to the function
+
+    Returns:
+    job (dict): Contains the thread, the cancel token, the latest progress and, once finished, the result or error"""
+
+    job = {"cancel": threading.Event(), "progress": None, "result": None, "error": None}
+
+    def update_progress(latest_progress):
+        job["progress"] = latest_progress
+
+    def run():
+        try:
+            job["result"] = function(*args, progress=update_progress, cancel=job["cancel"], **kwargs)
+        except Exception as error:
+            job["error"] = error
+
+    job["thread"] = threading.Thread(target=run, daemon=True)
+    job["thread"].start()
+    return job
+
+
+def cancel_job(job):
+    """Asks a background job to stop, it raises JobCancelled the next time it checks
+
+    Parameters:
+    job (dict): The job from start_job"""
+
+    job["cancel"].set()
+
+
+def wait_for_job(job, timeout=None):
+    """Waits for a background job to finish
+
+    Parameters:
+    job (dict): The job from start_job
+    timeout (float): The most seconds to wait, default is None to wait until it finishes
+
+    Returns:
+    result: What the function returned, or None if it is still running
+
+    Raises:
+    The job's error, e.g. JobCancelled, if it failed"""
+
+    job["thread"].join(timeout)
+
+    if job["thread"].is_alive():
+        return None
+    if job["error"] is not None:
+        raise job["error"]
+
+    return job["result"]
+
+
 # My functions
 
+def get_progress(rows_done, rows_total, width, components, start_time):
+    """Builds the progress update passed to progress callbacks
+
+    Parameters:
+    rows_done (int): The number of rows processed
+    rows_total (int): The number of rows in the image
+    width (int): The number of pixels in each row
+    components (int): The number of components found so far
+    start_time (float): When the job started, from time.monotonic
+
+    Returns:
+    progress (dict): Contains the rows and pixels processed, the percentage done, throughput and ETA in seconds"""
+
+    elapsed = time.monotonic() - start_time
+    pixels_done = rows_done * width
+    pixels_per_second = pixels_done / elapsed if elapsed else 0
+    pixels_left = (rows_total - rows_done) * width
+
+    progress = {
+        "rows_done": rows_done,
+        "rows_total": rows_total,
+        "pixels_done": pixels_done,
+        "pixels_total": rows_total * width,
+        "percent": 100 * rows_done / rows_total if rows_total else 100,
+        "components": components,
+        "elapsed": elapsed,
+        "pixels_per_second": pixels_per_second,
+        "eta": pixels_left / pixels_per_second if pixels_per_second else None
+    }
+
+    return progress
+
+
+def print_progress(progress):
+    """Progress callback which prints the percentage done every 10%, the default of detect_connected_components
+
+    Parameters:
+    progress (dict): The progress update from get_progress"""
+
+    rows_done = progress["rows_done"]
+    rows_total = progress["rows_total"]
+
+    # Printing when this row crosses into the next 10%
+    if rows_done * 10 // rows_total != (rows_done - 1) * 10 // rows_total:
+        print(f" {rows_done * 10 // rows_total * 10}%")
+
+
+def format_progress(progress):
+    """Formats a progress update as one line, e.g. for the menu or the command line
+
+    Parameters:
+    progress (dict): The progress update from get_progress
+
+    Returns:
+    line (str): The percentage done, throughput and ETA"""
+
+    eta = "unknown" if progress["eta"] is None else f"{progress['eta']:.0f}s"
+    line = (f" {progress['percent']:5.1f}% - {progress['rows_done']}/{progress['rows_total']} rows, "
+            f"{progress['pixels_per_second']:,.0f} pixels/s, {progress['components']} components, ETA {eta}")
+    return line
+
+
+def print_components(connected_components):
+    """Prints the number of pixels of every connected component
+
+    Parameters:
+    connected_components (dict): The components from convert_to_dict"""
+
+    print("")
+    for key in connected_components:
+        print(f" Connected Component {int(key)}, number of pixels = {connected_components[key]}")
+
+
 def bubble_sort(array):
     """Bubble sort descending algorithm modified to fit a 2D array
 
@@ -225,6 +523,110 @@ def bubble_sort(array):
     return array
 
 
+def add_component_pixel(bounds, y, x):
+    """Adds a pixel to the bounds, pixel count and coordinate sums of a component
+
+    Parameters:
+    bounds (list): [min y, min x, max y, max x, pixels, sum of y, sum of x], changed in place
+    y (int): The row of the pixel
+    x (int): The column of the pixel"""
+
+    bounds[0] = min(bounds[0], y)
+    bounds[1] = min(bounds[1], x)
+    bounds[2] = max(bounds[2], y)
+    bounds[3] = max(bounds[3], x)
+    bounds[4] += 1
+    bounds[5] += y
+    bounds[6] += x
+
+
+def create_spatial_index(component_bounds, cell_size=32):
+    """Puts the bounding boxes of components into a uniform grid, each cell listing the components overlapping it
+
+    Parameters:
+    component_bounds (dict): [min y, min x, max y, max x, pixels, sum of y, sum of x] of every component code
+    cell_size (int): The size in pixels of the grid cells, default is 32
+
+    Returns:
+    index (dict): Contains the bounding box ('bbox' as (min y, min x, max y, max x)), centroid and pixel
+                  count of every component, and the grid of cells mapping (cell row, cell column) to the
+                  component codes overlapping it"""
+
+    components = {}
+    grid = {}
+    grid_shape = (0, 0)
+
+    for label, (min_y, min_x, max_y, max_x, pixels, sum_y, sum_x) in component_bounds.items():
+        components[label] = {
+            "bbox": (min_y, min_x, max_y, max_x),
+            "centroid": (sum_y / pixels, sum_x / pixels),
+            "pixels": pixels
+        }
+
+        for cell_row in range(min_y // cell_size, max_y // cell_size + 1):
+            for cell_column in range(min_x // cell_size, max_x // cell_size + 1):
+                grid.setdefault((cell_row, cell_column), []).append(label)
+
+        grid_shape = (max(grid_shape[0], max_y // cell_size + 1), max(grid_shape[1], max_x // cell_size + 1))
+
+    index = {"cell_size": cell_size, "grid_shape": grid_shape, "components": components, "grid": grid}
+    return index
+
+
+def get_ring_cells(point_row, point_column, ring, grid_shape):
+    """Lists the cells of the grid on the edge of a square ring of cells around a point's cell, skipping those
+    outside the grid
+
+    Parameters:
+    point_row (int): The cell row of the point
+    point_column (int): The cell column of the point
+    ring (int): How many cells out from the point's cell the ring is, 0 being the point's cell
+    grid_shape (tuple): The number of (rows, columns) of cells in the grid
+
+    Returns:
+    cells (list): The (cell row, cell column) of every cell on the ring inside the grid"""
+
+    grid_rows, grid_columns = grid_shape
+    top, bottom = point_row - ring, point_row + ring
+    left, right = point_column - ring, point_column + ring
+
+    cells = []
+    # The top and bottom edges, including the corners
+    for cell_row in sorted({top, bottom}):
+        if 0 <= cell_row < grid_rows:
+            columns = range(max(left, 0), min(right, grid_columns - 1) + 1)
+            cells += [(cell_row, cell_column) for cell_column in columns]
+
+    # The left and right edges, without the corners
+    for cell_column in sorted({left, right}) if ring else ():
+        if 0 <= cell_column < grid_columns:
+            rows = range(max(top + 1, 0), min(bottom - 1, grid_rows - 1) + 1)
+            cells += [(cell_row, cell_column) for cell_row in rows]
+
+    return cells
+
+
+def get_component_distance(component, row, column):
+    """Measures how far a point is from a component
+
+    Parameters:
+    component (dict): The component's entry in a spatial index
+    row (float): The row of the point
+    column (float): The column of the point
+
+    Returns:
+    distance (float): The distance to the component's bounding box, 0 if the point is inside it
+    centroid_distance (float): The distance to the component's centroid"""
+
+    min_y, min_x, max_y, max_x = component["bbox"]
+    row_gap = max(min_y - row, 0, row - max_y)
+    column_gap = max(min_x - column, 0, column - max_x)
+    distance = float(np.hypot(row_gap, column_gap))
+
+    centroid_distance = float(np.hypot(component["centroid"][0] - row, component["centroid"][1] - column))
+    return distance, centroid_distance
+
+
 def convert_to_dict(input):
     """Converts a 2D numpy array to a dictionary for the 'detected_components' and 'detected_components_sorted'
     functions to use when printing.
@@ -278,3 +680,22 @@ def load_colour_map(map_filename):
 
     colour_map = mat_plot.imread(map_filename)
     return colour_map
+
+
+if __name__ == '__main__':
+    # Finds the connected components of a map from the command line, e.g. python intelligence.py data/map.png red
+    if len(sys.argv) < 3 or sys.argv[2] not in ("red", "cyan"):
+        sys.exit(" Usage: python intelligence.py <map file> <red|cyan>")
+
+    if sys.argv[2] == "red":
+        colour_map = find_red_pixels(sys.argv[1])
+    else:
+        colour_map = find_cyan_pixels(sys.argv[1])
+
+    try:
+        detect_connected_components(colour_map, verbose=False,
+                                    progress=lambda x: sys.stderr.write("\r" + format_progress(x)))
+    except KeyboardInterrupt:
+        sys.exit("\n Cancelled.")
+
+    print("\n Components written to 'cc-output-2a.txt' in the data folder.")
@@ -1,11 +1,14 @@
 from os import system, name
 from matplotlib import pyplot as mat_plot
-import pandas as pd
 import datetime
 import reporting
 import intelligence
 import monitoring
+import profiling
+import catalogue
+import store
 import sys
+import atexit
 
 # The different screens of the UI
 
@@ -64,48 +67,49 @@ monitoring_menu_screen = """\
   • B - Check for warnings on pollutant levels
   • C - Get pollutant descriptions
   • D - Export data given: pollutant, station, end and start date
+  • E - Continuously monitor pollutant levels
+  • F - Compare a pollutant at every station given: pollutant, end and start date
 
   • M - Go back to Main Menu
   • Q - Quit the application
  ────────────────────────────
 """
 
-station_menu_screen = """\
+# Keys used to select stations and pollutants, skipping R and Q which return and quit
+selection_keys = list("ABCDEFGHIJKLMNOPSTUVWXYZ")
+
+# Maps the selection keys to the stations and pollutants in the catalogue
+# Catalogues with more entries than letters use numbers for the rest
+station_menu_keys = {(selection_keys[index] if index < len(selection_keys) else str(index + 1)): name
+                     for index, name in enumerate(catalogue.station_names())}
+pollutant_menu_keys = {(selection_keys[index] if index < len(selection_keys) else str(index + 1)): name
+                       for index, name in enumerate(catalogue.pollutant_names())}
+
+station_menu_screen = f"""\
  ────────────────────────────
  Select a monitoring station
 
- • A - London Harlington
- • B - London Marylebone Road
- • C - London N Kensington
+{chr(10).join(f" • {key} - {catalogue.get_station(name)['description']}" for key, name in station_menu_keys.items())}
 
  • R - Return to sub-menu
  • Q - Quit the application
  ────────────────────────────
 """
 
-pollutant_menu_screen = """\
+pollutant_menu_screen = f"""\
  ────────────────────────────
  Select a pollutant
 
- • A - no
- • B - pm10
- • C - pm25
+{chr(10).join(f" • {key} - {name}" for key, name in pollutant_menu_keys.items())}
 
  • R - Return to sub-menu
  • Q - Quit the application
  ────────────────────────────
 """
 
-# Reading the pollution data csv files
-df_harlington = pd.read_csv('data/Pollution-London Harlington.csv')
-df_marylebone = pd.read_csv('data/Pollution-London Marylebone Road.csv')
-df_kensington = pd.read_csv('data/Pollution-London N Kensington.csv')
-
-pollutant_data = {
-    "Harlington": df_harlington,
-    "Marylebone Road": df_marylebone,
-    "N Kensington": df_kensington
-}
+# Reading the pollution data csv files, stored as arrays rather than dataframes to save memory
+pollutant_data = {station: store.load_station_store(catalogue.station_file(station))
+                  for station in catalogue.station_names()}
 
 
 
@@ -160,7 +164,7 @@ def quit():
 def get_daily_average():
     """Prints the average for every day over the year 2021 for a given pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
@@ -179,7 +183,7 @@ def get_daily_average():
 def get_daily_median():
     """Prints the median for every day over the year 2021 for a given pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
@@ -198,7 +202,7 @@ def get_daily_median():
 def get_hourly_average():
     """Prints the average for every hour of the day over the year 2021 for a given pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
@@ -217,7 +221,7 @@ def get_hourly_average():
 def get_monthly_average():
     """Prints the average for every month over the year 2021 for a given pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
@@ -236,7 +240,7 @@ def get_monthly_average():
 def get_peak_hour_data():
     """Prints the greatest value and the hour it was recorded for a given date (in 2021), pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
@@ -259,7 +263,7 @@ def get_peak_hour_data():
 def count_missing_data():
     """Prints the number of missing data entries over the year 2021 for a given pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
@@ -275,18 +279,24 @@ def count_missing_data():
 
 def fill_missing_data():
     """Prints the data after replacing every instance of missing data in the CSV with the value given,
-    for a given pollutant and station
+    or with values from an imputation strategy, for a given pollutant and station
 
-    Reads data from CSV files stored at dataframes in the 'pollutant_data' dict"""
+    Reads data from CSV files stored as arrays in the 'pollutant_data' dict"""
 
     monitoring_station = get_monitoring_station_input(return_menu="R")
     pollutant = get_pollutant_input(return_menu="R")
     clear_screen()
 
+    strategies = ("linear", "time", "seasonal", "station")
+
     while True:
-        new_value = input("\n Enter the value you want to fill empty entries with, e.g. 10\n ")
+        new_value = input("\n Enter the value you want to fill empty entries with, e.g. 10, or a strategy:"
+                          "\n 'linear', 'time', 'seasonal' or 'station'\n ").lower()
         clear_screen()
 
+        if new_value in strategies:
+            break
+
         try:
             new_value = float(new_value)
         except ValueError:
@@ -294,10 +304,15 @@ def fill_missing_data():
 
         break
 
-    new_pollutant_data = reporting.fill_missing_data(pollutant_data, new_value, monitoring_station, pollutant)
+    if new_value in strategies:
+        new_pollutant_data, fill_counts = reporting.impute_missing_data(pollutant_data, monitoring_station,
+                                                                        pollutant, methods=(new_value,))
+        print(f"\n The '{new_value}' strategy filled {fill_counts[new_value]} entries.")
+    else:
+        new_pollutant_data = reporting.fill_missing_data(pollutant_data, new_value, monitoring_station, pollutant)
 
     print(f"\n The updated table at {monitoring_station}:\n")
-    print(new_pollutant_data[monitoring_station].to_string())
+    print_table_paged(store.to_dataframe(new_pollutant_data[monitoring_station]))
 
     input("\n Press enter to go back to Pollutant Reporting Menu\n ")
     reporting_menu()
@@ -369,14 +384,16 @@ def detect_connected_components():
 
     try:
         if colour == "RED":
-            intelligence.detect_connected_components(intelligence.find_red_pixels(file_name))
+            run_components_job(intelligence.find_red_pixels(file_name))
         elif colour == "CYAN":
-            intelligence.detect_connected_components(intelligence.find_cyan_pixels(file_name))
+            run_components_job(intelligence.find_cyan_pixels(file_name))
 
         print("\n Task completed, output file 'cc-output-2a' saved in data folder.")
 
     except FileNotFoundError:
         print("\n Task failed, filename incorrect.")
+    except intelligence.JobCancelled:
+        print("\n Task cancelled.")
 
     input("\n Press enter to go back to Mobility Intelligence Menu\n ")
     intelligence_menu()
@@ -401,20 +418,52 @@ def detect_connected_components_sorted():
 
     try:
         if colour == "RED":
-            intelligence.detect_connected_components_sorted(intelligence.detect_connected_components
-                                                        (intelligence.find_red_pixels(file_name)))
+            intelligence.detect_connected_components_sorted(run_components_job(intelligence.find_red_pixels(file_name)))
         elif colour == "CYAN":
-            intelligence.detect_connected_components_sorted(intelligence.detect_connected_components(intelligence.find_cyan_pixels(file_name)))
+            intelligence.detect_connected_components_sorted(run_components_job(intelligence.find_cyan_pixels(file_name)))
 
         print("\n Task completed, output file 'cc-output-2b' saved in data folder.")
 
     except FileNotFoundError:
         print("\n Task failed, filename incorrect.")
+    except intelligence.JobCancelled:
+        print("\n Task cancelled.")
 
     input("\n Press enter to go back to Mobility Intelligence Menu\n ")
     intelligence_menu()
 
 
+def run_components_job(colour_map):
+    """Detects the connected components of a colour map in the background, showing the progress and ETA
+    until it finishes. Pressing Ctrl+C cancels it
+
+    Parameters:
+    colour_map (np.ndarray): The binary colour map from 'find_red_pixels' or 'find_cyan_pixels'
+
+    Returns:
+    MARK (np.ndarray): The components found by 'detect_connected_components'"""
+
+    job = intelligence.start_job(intelligence.detect_connected_components, colour_map, verbose=False)
+    print("\n Detecting connected components, press Ctrl+C to cancel.\n")
+
+    while True:
+        try:
+            MARK = intelligence.wait_for_job(job, timeout=0.5)
+        except KeyboardInterrupt:
+            intelligence.cancel_job(job)
+            continue
+
+        if job["progress"] is not None:
+            sys.stdout.write("\r" + intelligence.format_progress(job["progress"]))
+            sys.stdout.flush()
+
+        if not job["thread"].is_alive():
+            break
+
+    intelligence.print_components(intelligence.convert_to_dict(MARK))
+    return MARK
+
+
 # Monitoring functions
 
 def pollutant_graph():
@@ -466,13 +515,68 @@ def export_data():
     end_date = get_date_input(end=True)
     clear_screen()
 
-    monitoring.export_data(monitoring_station, pollutant, start_date, end_date)
+    while True:
+        file_format = input(f"\n Enter a file format: {', '.join(monitoring.export_formats)}"
+                            f"\n Or press enter for csv\n ").lower() or "csv"
+        clear_screen()
+
+        if file_format in monitoring.export_formats:
+            break
+
+    try:
+        monitoring.export_data(monitoring_station, pollutant, start_date, end_date, file_format)
+    except Exception as error:
+        print(f"\n Export failed: {error}")
+        input("\n Press enter to go back to Real-time Monitoring Menu\n ")
+        monitoring_menu()
+        return
+
     print("\n Export complete.")
 
     input("\n Press enter to go back to Real-time Monitoring Menu\n ")
     monitoring_menu()
 
 
+def continuous_monitoring():
+    """Polls the LondonAir API every 15 minutes for new readings of every pollutant at every station and
+    prints a message whenever a warning level changes, until the user presses Ctrl+C"""
+
+    clear_screen()
+    print("\n Monitoring pollutant levels, press Ctrl+C to stop.")
+
+    monitor = monitoring.create_monitor()
+    try:
+        monitoring.run_monitor(monitor)
+    except KeyboardInterrupt:
+        pass
+
+    metrics = monitoring.monitor_metrics(monitor)
+    print(f"\n Made {metrics['requests']} requests ({metrics['failed_requests']} failed) "
+          f"at {metrics['request_rate']:.2f} per minute, with a mean latency of {metrics['mean_latency']:.3f}s.")
+
+    input("\n Press enter to go back to Real-time Monitoring Menu\n ")
+    monitoring_menu()
+
+
+def compare_pollutant_graphs():
+    """Presents graphs of a given pollutant at every station between two given dates side by side, sharing the
+    same y axis"""
+
+    pollutant = get_pollutant_input(return_menu="M")
+    start_date = get_date_input(start=True)
+    end_date = get_date_input(end=True)
+    clear_screen()
+
+    try:
+        graphs = monitoring.compare_pollutant_graphs(catalogue.station_names(), pollutant, start_date, end_date)
+    except Exception as error:
+        graphs = f"\n Couldn't get the data: {error}"
+    print(graphs)
+
+    input("\n Press enter to go back to Real-time Monitoring Menu\n ")
+    monitoring_menu()
+
+
 # Input functions
 
 def get_monitoring_station_input(return_menu="R"):
@@ -486,12 +590,8 @@ def get_monitoring_station_input(return_menu="R"):
         print(station_menu_screen)
         user_input = input(" ").upper()
 
-        if user_input == "A":
-            return "Harlington"
-        elif user_input == "B":
-            return "Marylebone Road"
-        elif user_input == "C":
-            return "N Kensington"
+        if user_input in station_menu_keys:
+            return station_menu_keys[user_input]
         elif user_input == "R":
             main_menu_dict[return_menu]()
         elif user_input == "Q":
@@ -509,12 +609,8 @@ def get_pollutant_input(return_menu="R"):
         print(pollutant_menu_screen)
         user_input = input(" ").upper()
 
-        if user_input == "A":
-            return "no"
-        elif user_input == "B":
-            return "pm10"
-        elif user_input == "C":
-            return "pm25"
+        if user_input in pollutant_menu_keys:
+            return pollutant_menu_keys[user_input]
         elif user_input == "R":
             main_menu_dict[return_menu]()
         elif user_input == "Q":
@@ -571,6 +667,78 @@ def get_date_input(start=False, end=False, specific_year=False, allow_today=Fals
     return output
 
 
+# Output functions
+
+def print_table_paged(df, page_size=48):
+    """Prints a dataframe one page at a time, only formatting the rows on the page being shown
+
+    Parameters:
+    df (pandas dataframe): The table being printed
+    page_size (int): The number of rows on each page, default is 48"""
+
+    number_of_pages = max(1, -(-len(df) // page_size))
+    page = 0
+
+    while True:
+        start = page * page_size
+        page_text = df.iloc[start:start + page_size].to_string(na_rep="No data")
+        sys.stdout.write(f"{page_text}\n\n Page {page + 1} of {number_of_pages}\n")
+
+        user_input = input(" Press enter for the next page, or enter P for the previous page, a page number,"
+                           " E to export the table or Q to stop\n ").upper()
+
+        if user_input == "Q":
+            return
+        elif user_input == "E":
+            # Asks again until the file can be written, or the user leaves it blank to go back to the table
+            while True:
+                file_name = input("\n Enter the file name to export to, e.g. data/table.csv, or leave it blank to"
+                                  " go back\n ")
+                if not file_name:
+                    break
+
+                try:
+                    export_table(df, file_name)
+                except OSError as error:
+                    print(f"\n Couldn't write '{file_name}': {error.strerror or error}")
+                    continue
+
+                print(f"\n Table exported to '{file_name}'.")
+                return
+        elif user_input == "P":
+            page = max(page - 1, 0)
+        elif user_input.isdigit():
+            page = min(max(int(user_input) - 1, 0), number_of_pages - 1)
+        elif page == number_of_pages - 1:
+            return
+        else:
+            page += 1
+
+        clear_screen()
+
+
+def export_table(df, file_name, chunk_size=2000):
+    """Writes a dataframe to a CSV file in chunks, so the whole table is never formatted in memory at once
+
+    Parameters:
+    df (pandas dataframe): The table being exported
+    file_name (str): The file being written to
+    chunk_size (int): The number of rows formatted and written at a time, default is 2000"""
+
+    with open(file_name, 'w', newline='', buffering=1024 * 1024) as f:
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+            chunk.to_csv(f, header=(start == 0), index=False, na_rep="No data")
+
+
+def print_profiling_report():
+    """Prints the profiling summary and writes the trace to 'profile-trace.json' in the data folder"""
+
+    print(profiling.profiling_report())
+    profiling.export_trace("data/profile-trace.json")
+    print(" Trace written to 'profile-trace.json' in the data folder, open it with chrome://tracing or Perfetto.")
+
+
 # Menu functions
 
 def load_menu(menu_name):
@@ -654,6 +822,8 @@ monitoring_menu_dict = {
     "B": pollutants_warning,
     "C": pollutant_description,
     "D": export_data,
+    "E": continuous_monitoring,
+    "F": compare_pollutant_graphs,
     "M": main_menu,
     "Q": quit
 }
@@ -675,4 +845,13 @@ menus_dict = {
 
 
 if __name__ == '__main__':
+    # Replays the CSV files in the data folder instead of using the LondonAir API
+    if "--offline" in sys.argv:
+        monitoring.set_data_source("csv")
+
+    # Records where time goes, printing a summary and writing a trace file on quitting
+    if "--profile" in sys.argv:
+        profiling.enable_profiling()
+        atexit.register(print_profiling_report)
+
     main_menu()
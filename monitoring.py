@@ -1,20 +1,61 @@
 import requests
+import numpy as np
+import pandas as pd
 import datetime
+import time
 import os
 import csv
+import sys
+import json
+import random
+import threading
+import gzip
+import io
+import tempfile
+from collections import deque
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import profiling
+import catalogue
+
+# Optional, only needed to export zstd compressed CSV files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Where get_live_data_from_api and pollutant_description get their data from, changed with set_data_source
+data_source = {
+    "source": "api",
+    "base_url": "https://api.erg.ic.ac.uk/AirQuality",
+    "latency": 0,
+    "recordings_folder": None,
+    "record": False
+}
+
+# The most seconds to wait for the API to connect or send data, so a stalled request can't hang a monitor
+request_timeout = 30
+
+# The year covered by the CSV files in the data folder, used when replaying them
+archive_year = 2021
 
-codes_dict = {
-    "Harlington": "LH0",
-    "Marylebone Road": "MY1",
-    "N Kensington": "KC1",
-    "no": "NO",
-    "pm10": "PM10",
-    "pm25": "PM25"
+# File formats export_data and export_series can write, mapped to their file extensions
+export_formats = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet",
+    "npy": ".npy",
+    "npz": ".npz"
 }
 
+# The number of CSV rows formatted before each write
+export_batch_rows = 10000
 
+
+@profiling.profiled
 def get_live_data_from_api(site_code='LH0',species_code='PM25',start_date=None,end_date=None):
-    """Return data from the LondonAir API using its AirQuality API.
+    """Return data from the LondonAir API using its AirQuality API, or from the source set with set_data_source.
 
     Parameters:
     site_code (str): Site code to get data about, default is 'LH0'
@@ -27,21 +68,107 @@ def get_live_data_from_api(site_code='LH0',species_code='PM25',start_date=None,e
 
     start_date = datetime.date.today() if start_date is None else start_date
     end_date = start_date + datetime.timedelta(days=1) if end_date is None else end_date
-    
-    endpoint = "https://api.erg.ic.ac.uk/AirQuality/Data/SiteSpecies/SiteCode={site_code}/" \
+
+    inject_latency(data_source["latency"])
+
+    if data_source["source"] == "csv":
+        return replay_site_species(site_code, species_code, start_date, end_date)
+
+    recording_name = f"SiteSpecies {site_code} {species_code} {start_date} {end_date}.json"
+    if data_source["source"] == "recorded":
+        return load_recording(recording_name)
+
+    endpoint = "{base_url}/Data/SiteSpecies/SiteCode={site_code}/" \
                "SpeciesCode={species_code}/StartDate={start_date}/EndDate={end_date}/Json"
    
     url = endpoint.format(
+        base_url = data_source["base_url"],
         site_code = site_code,
         species_code = species_code,
         start_date = start_date,
         end_date = end_date
     )
     
-    res = requests.get(url)
-    return res.json()
+    res = requests.get(url, timeout=request_timeout)
+    profiling.add_count("bytes_fetched", len(res.content))
+    data = res.json()
+
+    if data_source["record"]:
+        save_recording(recording_name, data)
+
+    return data
+
+
+def set_data_source(source="api", base_url=None, latency=0, recordings_folder=None, record=False):
+    """Changes where the monitoring functions get their data from, e.g. to work offline or to load-test
+
+    Parameters:
+    source (str): 'api' for HTTP requests, 'csv' to replay the CSV files in the data folder or
+                  'recorded' to replay saved responses, default is 'api'
+    base_url (str): The AirQuality API address, e.g. the address of serve_replay_api,
+                    default is None for the LondonAir API
+    latency (float or tuple): Seconds added to every request, or a (minimum, maximum) range to pick
+                              from at random, default is 0
+    recordings_folder (str): The folder responses are saved to and replayed from, default is None
+    record (bool): Saves every API response to recordings_folder, default is False"""
+
+    if source not in ("api", "csv", "recorded"):
+        raise Exception("Invalid data source passed")
+    if (source == "recorded" or record) and recordings_folder is None:
+        raise Exception("A recordings folder is needed to record or replay responses")
+
+    data_source["source"] = source
+    data_source["base_url"] = "https://api.erg.ic.ac.uk/AirQuality" if base_url is None else base_url.rstrip("/")
+    data_source["latency"] = latency
+    data_source["recordings_folder"] = recordings_folder
+    data_source["record"] = record
+
+
+def serve_replay_api(port=8000, latency=0, background=True):
+    """Runs a local HTTP stand-in for the LondonAir API which answers from the CSV files in the data folder.
+    Point the monitoring functions at it with set_data_source(base_url=f"http://localhost:{port}/AirQuality")
+
+    Parameters:
+    port (int): The port to listen on, default is 8000
+    latency (float or tuple): Seconds added to every response, or a (minimum, maximum) range, default is 0
+    background (bool): Serves from a daemon thread and returns straight away, default is True
+
+    Returns:
+    server (ThreadingHTTPServer): The running server, stop it with server.shutdown()"""
+
+    class ReplayRequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            inject_latency(latency)
+
+            try:
+                data = replay_request(self.path)
+            except (KeyError, ValueError):
+                self.send_error(404)
+                return
 
+            body = json.dumps(data).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
 
+        def log_message(self, *args):
+            # Keeps the terminal clear while serving
+            pass
+
+    server = ThreadingHTTPServer(("localhost", port), ReplayRequestHandler)
+
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+
+    return server
+
+
+@profiling.profiled
 def pollutant_graph(station, pollutant, date):
     """Returns a text-based graph for a given pollutant, station and date
 
@@ -69,6 +196,7 @@ def pollutant_graph(station, pollutant, date):
     return graph
 
 
+@profiling.profiled
 def pollutants_warning():
     """Compares the values of the 3 pollutants for the 3 stations against set thresholds and returns a report
 
@@ -76,62 +204,28 @@ def pollutants_warning():
     report (str): A report of any pollutants with too high values at which station)"""
 
     warnings = []
+    codes_dict = catalogue.get_codes()
 
-    stations = ["Harlington", "Marylebone Road", "N Kensington"]
-    for station in stations:
+    for station in catalogue.station_names():
         station_code = codes_dict[station]
 
-        # Retrieves the most recent data (that isn't empty) for each pollutant
-        no_raw_data = get_live_data_from_api(station_code, "NO")
-        no_value = float(get_most_recent_value(no_raw_data))
-
-        pm10_raw_data = get_live_data_from_api(station_code, "PM10")
-        pm10_value = float(get_most_recent_value(pm10_raw_data))
-
-        pm25_raw_data = get_live_data_from_api(station_code, "PM25")
-        pm25_value = float(get_most_recent_value(pm25_raw_data))
-
-        # Checks values against benchmarks found from research
-        # Assigns a warning level with 0 being the most critical
-
-        if no_value > 30000:
-            warnings.append((station, "NO", 0))
-        elif no_value > 120000:
-            warnings.append((station, "NO", 0))
-
-        if pm10_value > 54:
-            warnings.append((station, "PM10", 3))
-        elif pm10_value > 154:
-            warnings.append((station, "PM10", 2))
-        elif pm10_value > 254:
-            warnings.append((station, "PM10", 1))
-        elif pm10_value > 354:
-            warnings.append((station, "PM10", 0))
-
-        if pm25_value > 12:
-            warnings.append((station, "PM25", 3))
-        elif pm25_value > 35.4:
-            warnings.append((station, "PM25", 2))
-        elif pm25_value > 55.4:
-            warnings.append((station, "PM25", 1))
-        elif pm25_value > 150.4:
-            warnings.append((station, "PM25", 0))
+        for pollutant in catalogue.pollutant_names():
+            pollutant_code = codes_dict[pollutant]
+
+            # Retrieves the most recent data (that isn't empty) for each pollutant
+            raw_data = get_live_data_from_api(station_code, pollutant_code)
+            value = float(get_most_recent_value(raw_data))
+
+            # Checks values against benchmarks found from research
+            # Assigns a warning level with 0 being the most critical
+            level = get_warning_level(pollutant_code, value)
+            if level != -1:
+                warnings.append((station, pollutant_code, level))
 
     # Generates warning messages
     warnings_messages = ""
-    for warning in warnings:
-        station = warning[0]
-        pollutant = warning[1]
-        level = warning[2]
-
-        if level == 0:
-            warnings_messages += (f"\n -A critical risk of {pollutant} at {station} station. ")
-        elif level == 1:
-            warnings_messages += (f"\n -A serious risk of {pollutant} at {station} station. ")
-        elif level == 2:
-            warnings_messages += (f"\n -A risk to vulnerable people of {pollutant} at {station} station. ")
-        elif level == 3:
-            warnings_messages += (f"\n -A moderate risk of {pollutant} at {station} station. ")
+    for station, pollutant, level in warnings:
+        warnings_messages += generate_warning_message(station, pollutant, level)
 
     if not warnings:
         report = f"""
@@ -152,6 +246,7 @@ def pollutants_warning():
     return report
 
 
+@profiling.profiled
 def pollutant_description(pollutant):
     """Gives a description of a given pollutant which is retrieved from the LondonAir API
 
@@ -161,20 +256,13 @@ def pollutant_description(pollutant):
     Returns:
     output (str): A formatted description of the pollutant"""
 
-    if pollutant == "no":
-        output = "\n There is no data available for 'NO'"
+    if not catalogue.get_pollutant(pollutant)["has_description"]:
+        output = f"\n There is no data available for '{pollutant.upper()}'"
         return output
 
     # Getting data from API
     pollutant_code = pollutant.upper()
-    endpoint = "http://api.erg.ic.ac.uk/AirQuality/Information/Species/SpeciesCode={species_code}/Json"
-
-    url = endpoint.format(
-        species_code = pollutant_code
-    )
-
-    res = requests.get(url)
-    data = res.json()
+    data = get_species_information_from_api(pollutant_code)
 
     description = data['AirQualitySpecies']['Species']['@Description']
     output = f"""
@@ -184,132 +272,310 @@ def pollutant_description(pollutant):
     return output
 
 
-def export_data(station, pollutant, start_date, end_date):
-    """Exports data from the LondonAir API to a CSV file for a given pollutant, station, start and end date
+@profiling.profiled
+def export_data(station, pollutant, start_date, end_date, file_format="csv"):
+    """Exports data from the LondonAir API to a file for a given pollutant, station, start and end date
 
     Parameters:
     station (str): Specifies which station to get data of
     pollutant (str): Specifies which pollutant to get data of
     start_date (str): Specifies the start date to get data from
     end_date (str): Specifies the end date to get data from
+    file_format (str): Any of the export_formats, default is 'csv'
 
     Returns:
     True: If it successfully exports.
     """
 
-    # Formatting inputs
-    station = convert_codes(station)
-    pollutant = convert_codes(pollutant)
+    # Selecting file name
+    file_name = get_export_file_name(f"Output File {convert_codes(station)} {convert_codes(pollutant)}",
+                                     file_format)
+
+    export_series([(station, pollutant)], start_date, end_date, file_name, file_format)
+    return True
+
+
+@profiling.profiled
+def export_series(series, start_date, end_date, file_name, file_format=None):
+    """Exports data from the LondonAir API for many station/pollutant pairs into one file in one pass,
+    with a row for every time any of them has a reading. The file is written to a temporary file first and
+    renamed, so it is never left half written
+
+    Parameters:
+    series (list): (station, pollutant) pairs of names from main.py, e.g. ('Harlington', 'pm10')
+    start_date (str): Specifies the start date to get data from
+    end_date (str): Specifies the end date to get data from
+    file_name (str): The file being written to
+    file_format (str): Any of the export_formats, default is None to use the extension of file_name
+
+    Returns:
+    rows (int): The number of rows written"""
+
+    if file_format is None:
+        file_format = get_export_format(file_name)
+    if file_format not in export_formats:
+        raise Exception("Invalid file format passed")
 
     start_date = convert_to_datetime(start_date)
     end_date = convert_to_datetime(end_date)
 
-    # Retrieving data
-    raw_data = get_live_data_from_api(station, pollutant, start_date, end_date)
-    data = extract_data(raw_data)
+    # Retrieving data, with the original header for a single pair
+    columns = {}
+    for station, pollutant in series:
+        station_code = convert_codes(station)
+        pollutant_code = convert_codes(pollutant)
 
-    # Selecting file name
-    counter = 0
-    file_name = f"data/Output File {station} {pollutant}.csv"
-    while file_exists(file_name):
-        counter += 1
-        file_name = f"data/Output File {station} {pollutant} ({counter}).csv"
+        if len(series) == 1:
+            column_name = f"{pollutant_code.lower()} (ug/m^3)"
+        else:
+            column_name = f"{station_code} {pollutant_code.lower()} (ug/m^3)"
 
-    # Writing to file
-    header = ["date", "time", f"{pollutant.lower()} (ug/m^3)"]
+        raw_data = get_live_data_from_api(station_code, pollutant_code, start_date, end_date)
+        columns[column_name] = extract_timestamped_data(raw_data)
 
-    with open(file_name, 'w', newline='') as f:
-        writer = csv.writer(f)
+    timestamps, texts, values = align_series(columns)
 
-        writer.writerow(header)
+    if file_format.startswith("csv"):
+        write_atomically(file_name, lambda temp_name: write_csv_export(temp_name, file_format, timestamps, texts))
+    elif file_format == "parquet":
+        write_atomically(file_name, lambda temp_name: write_parquet_export(temp_name, timestamps, values))
+    else:
+        write_atomically(file_name, lambda temp_name: write_numpy_export(temp_name, file_format, timestamps,
+                                                                         values))
 
-        date = start_date
-        for index, element in enumerate(data):
+    profiling.add_count("rows", len(timestamps))
+    profiling.add_count("bytes_written", os.path.getsize(file_name))
+    return len(timestamps)
 
-            # Calculate hour and increment date accordingly
-            hour = index % 24
-            if hour == 1:
-                date = date + datetime.timedelta(days=1)
 
-            writer.writerow([date, f"{hour:02d}:00", element])
+def create_monitor(stations=None, pollutants=None, window_hours=24):
+    """Creates the state for a continuous monitor which polls the LondonAir API for new readings
 
-    return True
+    Parameters:
+    stations (list): Names of the stations to monitor, default is every station in the catalogue
+    pollutants (list): Names of the pollutants to monitor, default is every pollutant in the catalogue
+    window_hours (int): The number of most recent readings kept in memory for each series, default is 24
 
+    Returns:
+    monitor (dict): Contains a rolling window and last-seen timestamp for every station/pollutant
+                    series along with the request metrics"""
 
-# My functions
+    stations = catalogue.station_names() if stations is None else stations
+    pollutants = catalogue.pollutant_names() if pollutants is None else pollutants
+
+    series = {}
+    for station in stations:
+        for pollutant in pollutants:
+            series[(station, pollutant)] = {
+                "last_seen": None,
+                "window": deque(maxlen=window_hours),
+                "level": -1
+            }
+
+    monitor = {
+        "series": series,
+        "metrics": {
+            "started": time.monotonic(),
+            "polls": 0,
+            "requests": 0,
+            "failed_requests": 0,
+            "invalid_responses": 0,
+            "readings": 0,
+            # Only the most recent latencies are kept so memory stays bounded
+            "latencies": deque(maxlen=1000)
+        }
+    }
+
+    return monitor
+
+
+@profiling.profiled
+def poll_monitor(monitor):
+    """Fetches only the readings newer than the last-seen timestamp of every monitored series and
+    evaluates the warning thresholds against the new readings
 
-def generate_graph(data):
-    """Generates a text-based graph for the passed data
-    
     Parameters:
-    data (list): Contains pollutant data to be inputted a graph
-    
+    monitor (dict): The state created by create_monitor, updated in place
+
     Returns:
-    graph (str): A text-based graph 
-    complete (bool): Indicates whether it was successful"""
+    warnings (list): Contains (station, pollutant, level) tuples for every series whose warning level changed"""
+
+    metrics = monitor["metrics"]
+    metrics["polls"] += 1
+    warnings = []
 
-    graph_data = [[" "] * 24 for _ in range(24)]
-    additional_values = []
-    complete = False
+    for (station, pollutant), series in monitor["series"].items():
 
-    # Iterating through data passed
-    for hour, value in enumerate(data):
+        # The API works in whole days of GMT, so the day of the last reading is requested again and filtered
+        last_seen = series["last_seen"]
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        start_date = today if last_seen is None else last_seen.date()
+        end_date = today + datetime.timedelta(days=1)
 
-        # Checking for no data
+        request_start = time.perf_counter()
+        try:
+            raw_data = get_live_data_from_api(convert_codes(station), convert_codes(pollutant),
+                                              start_date, end_date)
+        except (requests.RequestException, ValueError):
+            metrics["failed_requests"] += 1
+            continue
+        finally:
+            metrics["requests"] += 1
+            metrics["latencies"].append(time.perf_counter() - request_start)
+
+        # Empty or malformed responses are counted and skipped, the next poll tries again
         try:
-            value = float(value)
-            complete = True
-        except ValueError:
-            value = 0
+            new_readings = extract_new_readings(raw_data, last_seen)
+        except (KeyError, TypeError, ValueError):
+            metrics["invalid_responses"] += 1
+            continue
 
-        # Rounding data to multiples of 2.5 to fit the graph
-        rounded_value = 2.5 * round(value / 2.5)
+        if not new_readings:
+            continue
 
-        # Making sure values fit in the graphs y axis
-        if rounded_value <= 50:
-            row = int(rounded_value // 2.5) - 1
-            graph_data[row][hour] = '*'
+        for timestamp, value in new_readings:
+            series["window"].append((timestamp, value))
+        series["last_seen"] = new_readings[-1][0]
+        metrics["readings"] += len(new_readings)
 
-        # If the value of the data is out of range of the graph
-        else:
-            additional_values.append((rounded_value, hour))
+        # Only the newest reading decides the current level, as with pollutants_warning
+        level = get_warning_level(convert_codes(pollutant), new_readings[-1][1])
+        if level != series["level"]:
+            series["level"] = level
+            warnings.append((station, convert_codes(pollutant), level))
 
-    # Sorting additional values in descending order
-    additional_rows = "\n"
-    additional_values.sort(key=lambda x: x[0], reverse=True)
+    return warnings
 
-    # Creating additional rows for values out of bounds
-    for rounded_value, hour in additional_values:
-        additional_rows += f"""\
-  {rounded_value:4}+ {' ' * (hour - 1)} * {' ' * (22 - hour)}
-      | {' ' * 22}
-"""
 
-    graph = additional_rows + f"""\
-   50 +  {'  '.join(graph_data[19]):70}
-      |  {'  '.join(graph_data[18]):70}
-   45 +  {'  '.join(graph_data[17]):70}
-      |  {'  '.join(graph_data[16]):70}
-   40 +  {'  '.join(graph_data[15]):70}
-      |  {'  '.join(graph_data[14]):70}
-   35 +  {'  '.join(graph_data[13]):70}
-      |  {'  '.join(graph_data[12]):70}
-   30 +  {'  '.join(graph_data[11]):70}
-      |  {'  '.join(graph_data[10]):70}
-   25 +  {'  '.join(graph_data[9]):70}
-      |  {'  '.join(graph_data[8]):70}
-   20 +  {'  '.join(graph_data[7]):70}
-      |  {'  '.join(graph_data[6]):70}
-   15 +  {'  '.join(graph_data[5]):70}
-      |  {'  '.join(graph_data[4]):70}
-   10 +  {'  '.join(graph_data[3]):70}
-      |  {'  '.join(graph_data[2]):70}
-    5 +  {'  '.join(graph_data[1]):70}
-      |  {'  '.join(graph_data[0]):70}
-    0 +--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+--+
-       00:00 02:00 04:00 06:00 08:00 10:00 12:00 14:00 16:00 18:00 20:00 22:00 
-"""
+def monitor_metrics(monitor):
+    """Summarises the request rate, request latency and data lag of a monitor
+
+    Parameters:
+    monitor (dict): The state created by create_monitor
+
+    Returns:
+    summary (dict): Contains the request rate (per minute), latencies (seconds) and the lag of each series (hours)"""
+
+    metrics = monitor["metrics"]
+    elapsed = time.monotonic() - metrics["started"]
+    latencies = sorted(metrics["latencies"])
+
+    summary = {
+        "polls": metrics["polls"],
+        "requests": metrics["requests"],
+        "failed_requests": metrics["failed_requests"],
+        "invalid_responses": metrics["invalid_responses"],
+        "readings": metrics["readings"],
+        "request_rate": metrics["requests"] / elapsed * 60 if elapsed else 0,
+        "mean_latency": sum(latencies) / len(latencies) if latencies else 0,
+        "p95_latency": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0,
+        "max_latency": latencies[-1] if latencies else 0,
+        "lag": {}
+    }
+
+    # Lag is how far behind the current time the most recent reading of a series is, both in UTC
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for key, series in monitor["series"].items():
+        last_seen = series["last_seen"]
+        summary["lag"][key] = None if last_seen is None else (now - last_seen).total_seconds() / 3600
+
+    return summary
+
+
+def get_window_values(monitor, station, pollutant):
+    """Returns the readings currently held in a monitor's rolling window, e.g. for reporting.rolling_mean
+
+    Parameters:
+    monitor (dict): The state created by create_monitor
+    station (str): The station of the series
+    pollutant (str): The pollutant of the series
+
+    Returns:
+    values (np.ndarray): The readings in ascending time order"""
+
+    window = monitor["series"][(station, pollutant)]["window"]
+    values = np.array([value for _, value in window], dtype=float)
+    return values
+
+
+def run_monitor(monitor, interval=900, iterations=None, on_warning=None):
+    """Polls the LondonAir API on a fixed schedule until stopped
+
+    Parameters:
+    monitor (dict): The state created by create_monitor
+    interval (int): The number of seconds between the start of each poll, default is 900
+    iterations (int): The number of polls to run before returning, default is None to run until interrupted
+    on_warning (function): Called with (station, pollutant, level) for every change in warning level,
+                           default is None to print a warning message
 
+    Returns:
+    monitor (dict): The updated monitor state"""
+
+    poll_number = 0
+    while iterations is None or poll_number < iterations:
+        poll_start = time.monotonic()
+
+        for station, pollutant, level in poll_monitor(monitor):
+            if on_warning is not None:
+                on_warning(station, pollutant, level)
+            elif level != -1:
+                print(generate_warning_message(station, pollutant, level))
+
+        poll_number += 1
+        if iterations is not None and poll_number >= iterations:
+            break
+
+        # Sleeping for the remainder of the interval keeps the schedule fixed
+        time.sleep(max(0, interval - (time.monotonic() - poll_start)))
+
+    return monitor
+
+
+@profiling.profiled
+def compare_pollutant_graphs(stations, pollutant, start_date, end_date, height=20, width=24):
+    """Returns text-based graphs of a given pollutant at several stations between two dates, side by side
+
+    Parameters:
+    stations (list): Specifies what stations to get data about from API
+    pollutant (str): Specifies what pollutant to get data about from API
+    start_date (str): Specifies the start date to get data from
+    end_date (str): Specifies the end date to get data from
+    height (int): The number of rows in each graph, default is 20
+    width (int): The number of columns in each graph, longer periods are averaged down to fit, default is 24
+
+    Returns:
+    graphs (str): The text-based graphs sharing the same y axis range"""
+
+    start_date = convert_to_datetime(start_date)
+    end_date = convert_to_datetime(end_date)
+
+    series = []
+    for station in stations:
+        raw_data = get_live_data_from_api(convert_codes(station), convert_codes(pollutant), start_date, end_date)
+        values = np.array([value if value else np.nan for value in extract_data(raw_data)], dtype=float)
+        series.append(values)
+
+    x_labels = (str(start_date), str(end_date))
+    graphs = render_graphs(series, titles=stations, height=height, width=width, x_labels=x_labels)
+    return graphs
+
+
+# My functions
+
+def generate_graph(data):
+    """Generates a text-based graph for the passed data, scaled to fit its values
+    
+    Parameters:
+    data (list): Contains pollutant data to be inputted a graph, one value for every hour of the day
+    
+    Returns:
+    graph (str): A text-based graph 
+    complete (bool): Indicates whether it was successful"""
+
+    values = np.array([value if value else np.nan for value in data], dtype=float)
+    complete = bool((~np.isnan(values)).any())
+
+    graph = "\n" + "\n".join(render_graph(values, x_labels=("00:00", "23:00"))) + "\n"
     return graph, complete
 
 
@@ -347,6 +613,271 @@ def get_most_recent_value(raw_data):
     return data[-1] if data else 0
 
 
+def render_graph(values, height=20, width=24, y_range=None, x_labels=None, title=""):
+    """Renders a text-based graph from an array of values of any length
+
+    Parameters:
+    values (np.ndarray): The values being plotted, with missing data as NaN
+    height (int): The number of rows in the graph, default is 20
+    width (int): The maximum number of columns, longer series are averaged down to fit, default is 24
+    y_range (tuple): The (minimum, maximum) of the y axis, default is None to scale to the values
+    x_labels (tuple): Labels printed under the first and last column, default is None
+    title (str): Printed above the graph, default is an empty string
+
+    Returns:
+    lines (list): Each line of the graph, all padded to the same length"""
+
+    values = downsample_values(values, width)
+
+    if y_range is None:
+        y_range = get_graph_range([values])
+    y_min, y_max = y_range
+
+    y_labels, footer = graph_template(height, len(values), y_min, y_max, x_labels)
+
+    # Finding the row of every value, 0 being the bottom row
+    present = ~np.isnan(values)
+    scaled = (np.where(present, values, y_min) - y_min) / (y_max - y_min) * (height - 1)
+    rows = np.clip(np.rint(scaled), 0, height - 1).astype(int)
+
+    grid = np.full((height, len(values)), "   ", dtype="<U3")
+    grid[rows[present], np.nonzero(present)[0]] = "  *"
+    # Values outside the y axis are marked on the top or bottom row
+    grid[height - 1, present & (values > y_max)] = "  ^"
+    grid[0, present & (values < y_min)] = "  v"
+
+    lines = [f"{title:^{len(footer[0])}}"]
+    for row in range(height - 1, -1, -1):
+        lines.append(y_labels[row] + "".join(grid[row]))
+    lines.extend(footer)
+
+    line_length = max(len(line) for line in lines)
+    lines = [f"{line:{line_length}}" for line in lines]
+    return lines
+
+
+def render_graphs(series, titles=None, height=20, width=24, y_range=None, x_labels=None, gap=4):
+    """Renders several text-based graphs side by side, sharing the same y axis range
+
+    Parameters:
+    series (list): Contains an array of values for every graph
+    titles (list): Contains the title of every graph, default is None
+    height (int): The number of rows in each graph, default is 20
+    width (int): The maximum number of columns in each graph, default is 24
+    y_range (tuple): The (minimum, maximum) of the y axis, default is None to scale to every series
+    x_labels (tuple): Labels printed under the first and last column, default is None
+    gap (int): The number of spaces between graphs, default is 4
+
+    Returns:
+    graphs (str): The graphs as one string"""
+
+    series = [downsample_values(values, width) for values in series]
+    titles = [""] * len(series) if titles is None else titles
+
+    if y_range is None:
+        y_range = get_graph_range(series)
+
+    rendered = [render_graph(values, height, width, y_range, x_labels, title)
+                for values, title in zip(series, titles)]
+
+    separator = " " * gap
+    graphs = "\n".join(separator.join(lines) for lines in zip(*rendered)) + "\n"
+    return graphs
+
+
+def write_graphs(series, stream=None, **options):
+    """Renders several text-based graphs side by side and writes them with a single write call
+
+    Parameters:
+    series (list): Contains an array of values for every graph
+    stream (file): Where the graphs are written, default is None for sys.stdout
+    options: Passed on to render_graphs"""
+
+    stream = sys.stdout if stream is None else stream
+    stream.write(render_graphs(series, **options))
+    stream.flush()
+
+
+@lru_cache(maxsize=64)
+def graph_template(height, width, y_min, y_max, x_labels=None):
+    """Builds the parts of a text-based graph which don't depend on the values, so they are only built once
+    for each size and range
+
+    Parameters:
+    height (int): The number of rows in the graph
+    width (int): The number of columns in the graph
+    y_min (float): The bottom of the y axis
+    y_max (float): The top of the y axis
+    x_labels (tuple): Labels printed under the first and last column, default is None
+
+    Returns:
+    y_labels (tuple): The left margin of every row, 0 being the bottom row
+    footer (tuple): The lines of the x axis"""
+
+    step = (y_max - y_min) / (height - 1) if height > 1 else 0
+
+    # Labelling every other row from the top
+    y_labels = tuple(f" {y_min + row * step:7.1f} +" if (height - 1 - row) % 2 == 0 else "         |"
+                     for row in range(height))
+
+    axis = "         +" + "--+" * width
+    if x_labels is None:
+        footer = (axis,)
+    else:
+        first, last = x_labels
+        label_row = f"{'':10}{first}"
+        label_row += f"{last:>{max(1, 10 + 3 * width - len(label_row))}}"
+        footer = (axis, label_row)
+
+    return y_labels, footer
+
+
+def get_graph_range(series):
+    """Finds a y axis range which fits every value in every series
+
+    Parameters:
+    series (list): Contains arrays of values, with missing data as NaN
+
+    Returns:
+    y_range (tuple): The (minimum, maximum) of the y axis"""
+
+    present = [values[~np.isnan(values)] for values in series]
+    present = [values for values in present if values.size]
+
+    if not present:
+        return 0.0, 1.0
+
+    y_min = min(0.0, min(float(values.min()) for values in present))
+    y_max = max(float(values.max()) for values in present)
+
+    # Rounding the top of the axis up to a multiple of 5 for readable labels
+    y_max = 5.0 * np.ceil(y_max / 5.0) if y_max > y_min else y_min + 1.0
+    return y_min, float(y_max)
+
+
+def downsample_values(values, width):
+    """Averages consecutive values so a series fits in a given number of columns, ignoring missing data
+
+    Parameters:
+    values (np.ndarray): The values being downsampled, with missing data as NaN
+    width (int): The maximum number of values to return
+
+    Returns:
+    values (np.ndarray): At most width values"""
+
+    values = np.asarray(values, dtype=float)
+    if len(values) <= width:
+        return values
+
+    # Splitting into exactly width buckets whose sizes differ by at most one, so none of them are empty
+    starts = np.arange(width) * len(values) // width
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0), starts)
+    counts = np.add.reduceat(present, starts)
+
+    # Buckets with no data are NaN, the same as missing values
+    values = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    return values
+
+
+def extract_new_readings(raw_data, last_seen=None):
+    """Extracts the non-empty readings which are newer than a given timestamp
+
+    Parameters:
+    raw_data (dict): A nested dictionary returned by get_live_data_from_api
+    last_seen (datetime.datetime): Readings at or before this time are skipped, default is None to keep all
+
+    Returns:
+    readings (list): Contains (timestamp, value) tuples in ascending time order, the timestamps being
+                     timezone-aware UTC as the API's are in GMT"""
+
+    readings = []
+
+    # Timestamps without a timezone are taken to be GMT, the same as the API's
+    if last_seen is not None and last_seen.tzinfo is None:
+        last_seen = last_seen.replace(tzinfo=datetime.timezone.utc)
+
+    for element in raw_data["RawAQData"]["Data"]:
+        if not element['@Value']:
+            continue
+
+        timestamp = datetime.datetime.strptime(element['@MeasurementDateGMT'], '%Y-%m-%d %H:%M:%S')
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+        if last_seen is not None and timestamp <= last_seen:
+            continue
+
+        readings.append((timestamp, float(element['@Value'])))
+
+    readings.sort(key=lambda x: x[0])
+    return readings
+
+
+def get_warning_level(pollutant, value):
+    """Compares a value against the warning bands for a pollutant and assigns a warning level
+
+    Parameters:
+    pollutant (str): The API code of the pollutant, e.g. 'PM10'
+    value (float): The value being checked
+
+    Returns:
+    level (int): The warning level with 0 being the most critical, or -1 if there is no warning"""
+
+    level = int(evaluate_warning_levels(pollutant, value))
+    return level
+
+
+def evaluate_warning_levels(pollutant, values, bands=None):
+    """Assigns a warning level to every value in an array at once using the warning bands for a pollutant
+
+    Parameters:
+    pollutant (str): The API code of the pollutant, e.g. 'PM10'
+    values (np.ndarray): Values of any shape, e.g. stations x hours. NaN is treated as missing data
+    bands (tuple): (threshold, level) pairs in ascending order of threshold, default is None to use the
+                   pollutant's warning bands from the catalogue, where a value above a threshold is given that
+                   threshold's level with 0 being the most critical
+
+    Returns:
+    levels (np.ndarray): An int8 array the same shape as values, with -1 where there is no warning"""
+
+    bands = catalogue.get_warning_bands()[pollutant] if bands is None else bands
+    thresholds = np.array([threshold for threshold, _ in bands], dtype=float)
+
+    # Index 0 means no threshold was exceeded, index i means the i-th threshold was the highest exceeded
+    band_levels = np.array([-1] + [level for _, level in bands], dtype=np.int8)
+
+    values = np.asarray(values, dtype=float)
+    band_indexes = np.searchsorted(thresholds, values, side="left")
+    levels = band_levels[band_indexes]
+
+    # Missing data never raises a warning
+    levels = np.where(np.isnan(values), -1, levels).astype(np.int8)
+    return levels
+
+
+def generate_warning_message(station, pollutant, level):
+    """Generates the warning message for a given warning level
+
+    Parameters:
+    station (str): The station the warning is for
+    pollutant (str): The pollutant the warning is for
+    level (int): The warning level with 0 being the most critical
+
+    Returns:
+    message (str): The warning message, or an empty string if there is no warning"""
+
+    if level == 0:
+        return f"\n -A critical risk of {pollutant} at {station} station. "
+    elif level == 1:
+        return f"\n -A serious risk of {pollutant} at {station} station. "
+    elif level == 2:
+        return f"\n -A risk to vulnerable people of {pollutant} at {station} station. "
+    elif level == 3:
+        return f"\n -A moderate risk of {pollutant} at {station} station. "
+
+    return ""
+
+
 def convert_codes(code):
     """Converts codes from main.py to be compatible with get_live_data_from_api
 
@@ -354,8 +885,204 @@ def convert_codes(code):
     code (str): Code from main.py
 
     Returns:
-    codes_dict[code] (str): A code that is compatible with get_live_data_from_api"""
-    return codes_dict[code]
+    code (str): A code that is compatible with get_live_data_from_api"""
+    return catalogue.get_codes()[code]
+
+
+def get_code_name(code):
+    """Converts a code used by get_live_data_from_api back to the name used in main.py
+
+    Parameters:
+    code (str): A code that is compatible with get_live_data_from_api, e.g. 'LH0'
+
+    Returns:
+    name (str): The name used in main.py, e.g. 'Harlington'"""
+
+    name = catalogue.get_name(code)
+    return name
+
+
+@profiling.profiled
+def get_species_information_from_api(species_code):
+    """Returns information about a pollutant from the LondonAir API, or from the source set with set_data_source
+
+    Parameters:
+    species_code (str): Code for pollutant to get information about, e.g. 'PM10'
+
+    Returns:
+    data (dict): Contains the information being retrieved from the API"""
+
+    inject_latency(data_source["latency"])
+
+    if data_source["source"] == "csv":
+        return replay_species_information(species_code)
+
+    recording_name = f"Species {species_code}.json"
+    if data_source["source"] == "recorded":
+        return load_recording(recording_name)
+
+    endpoint = "{base_url}/Information/Species/SpeciesCode={species_code}/Json"
+
+    url = endpoint.format(
+        base_url = data_source["base_url"],
+        species_code = species_code
+    )
+
+    res = requests.get(url, timeout=request_timeout)
+    profiling.add_count("bytes_fetched", len(res.content))
+    data = res.json()
+
+    if data_source["record"]:
+        save_recording(recording_name, data)
+
+    return data
+
+
+def replay_site_species(site_code, species_code, start_date, end_date):
+    """Builds a response shaped like the API's SiteSpecies data from the CSV files in the data folder.
+    Dates outside the archive year are replayed from the same day of the archive year
+
+    Parameters:
+    site_code (str): Site code to get data about, e.g. 'LH0'
+    species_code (str): Code for pollutant to get data about, e.g. 'PM25'
+    start_date (datetime.date or str): The start date for the data to retrieve
+    end_date (datetime.date or str): The end date for the data to retrieve
+
+    Returns:
+    data (dict): Contains the data in the same shape as the API"""
+
+    start_date = convert_to_datetime(str(start_date))
+    end_date = convert_to_datetime(str(end_date))
+
+    values = load_archive_values(get_code_name(site_code), get_code_name(species_code))
+
+    # Shifting the request into the archive year
+    if (start_date.month, start_date.day) == (2, 29):
+        replay_start = datetime.date(archive_year, 2, 28)
+    else:
+        replay_start = start_date.replace(year=archive_year)
+    first_row = (replay_start - datetime.date(archive_year, 1, 1)).days * 24
+
+    number_of_hours = (end_date - start_date).days * 24
+    start_time = datetime.datetime.combine(start_date, datetime.time())
+
+    readings = []
+    for hour in range(number_of_hours):
+        row = first_row + hour
+        value = values[row] if 0 <= row < len(values) else ""
+        timestamp = start_time + datetime.timedelta(hours=hour)
+        readings.append({"@MeasurementDateGMT": timestamp.strftime('%Y-%m-%d %H:%M:%S'), "@Value": value})
+
+    profiling.add_count("rows", number_of_hours)
+
+    data = {
+        "RawAQData": {
+            "@SiteCode": site_code,
+            "@SpeciesCode": species_code,
+            "Data": readings
+        }
+    }
+
+    return data
+
+
+def replay_species_information(species_code):
+    """Builds a response shaped like the API's species information from the catalogue's offline descriptions
+
+    Parameters:
+    species_code (str): Code for pollutant to get information about, e.g. 'PM10'
+
+    Returns:
+    data (dict): Contains the information in the same shape as the API"""
+
+    data = {
+        "AirQualitySpecies": {
+            "Species": {
+                "@SpeciesCode": species_code,
+                "@Description": catalogue.get_pollutant(get_code_name(species_code))["offline_description"]
+            }
+        }
+    }
+
+    return data
+
+
+def replay_request(path):
+    """Answers a request to the AirQuality API from the CSV files, used by serve_replay_api
+
+    Parameters:
+    path (str): The path of the request, e.g. '/AirQuality/Information/Species/SpeciesCode=PM10/Json'
+
+    Returns:
+    data (dict): Contains the response in the same shape as the API"""
+
+    # Turns 'SiteCode=LH0/SpeciesCode=PM10/...' into a dict of the parameters
+    parts = path.strip("/").split("/")
+    parameters = dict(part.split("=", 1) for part in parts if "=" in part)
+
+    if "/Data/SiteSpecies/" in path:
+        return replay_site_species(parameters["SiteCode"], parameters["SpeciesCode"],
+                                   parameters["StartDate"], parameters["EndDate"])
+    if "/Information/Species/" in path:
+        return replay_species_information(parameters["SpeciesCode"])
+
+    raise KeyError(path)
+
+
+@lru_cache(maxsize=None)
+def load_archive_values(station, pollutant):
+    """Reads one pollutant column of a station's CSV file as API-style value strings, only once per column
+
+    Parameters:
+    station (str): The name of the station, e.g. 'Harlington'
+    pollutant (str): The name of the pollutant, e.g. 'pm10'
+
+    Returns:
+    values (tuple): Contains a value for every hour of the archive year, with missing data as empty strings"""
+
+    with open(catalogue.station_file(station), newline='') as f:
+        values = tuple("" if row[pollutant] == "No data" else row[pollutant] for row in csv.DictReader(f))
+
+    return values
+
+
+def inject_latency(latency):
+    """Sleeps to simulate a slow connection
+
+    Parameters:
+    latency (float or tuple): Seconds to sleep, or a (minimum, maximum) range to pick from at random"""
+
+    if isinstance(latency, tuple):
+        latency = random.uniform(*latency)
+    if latency:
+        time.sleep(latency)
+
+
+def save_recording(name, data):
+    """Saves an API response to the recordings folder
+
+    Parameters:
+    name (str): The file name of the recording
+    data (dict): The response being saved"""
+
+    os.makedirs(data_source["recordings_folder"], exist_ok=True)
+    with open(os.path.join(data_source["recordings_folder"], name), 'w') as f:
+        json.dump(data, f)
+
+
+def load_recording(name):
+    """Loads an API response from the recordings folder
+
+    Parameters:
+    name (str): The file name of the recording
+
+    Returns:
+    data (dict): The saved response"""
+
+    with open(os.path.join(data_source["recordings_folder"], name)) as f:
+        data = json.load(f)
+
+    return data
 
 
 def convert_to_datetime(date):
@@ -370,6 +1097,213 @@ def convert_to_datetime(date):
     return output
 
 
+def get_export_format(file_name):
+    """Works out the export format from a file's extension
+
+    Parameters:
+    file_name (str): The name of the file, e.g. 'data/export.csv.gz'
+
+    Returns:
+    file_format (str): The export format, e.g. 'csv.gz'"""
+
+    # Longest extensions first, so '.csv.gz' isn't taken as '.gz'
+    for file_format, extension in sorted(export_formats.items(), key=lambda x: -len(x[1])):
+        if file_name.endswith(extension):
+            return file_format
+
+    raise Exception("Unknown file extension passed")
+
+
+def get_export_file_name(base_name, file_format, folder="data"):
+    """Finds the first unused export file name, e.g. 'Output File LH0 NO (2).csv', listing the folder once
+    rather than checking each name in turn
+
+    Parameters:
+    base_name (str): The file name without a counter or extension
+    file_format (str): Any of the export_formats
+    folder (str): The folder being written to, default is 'data'
+
+    Returns:
+    file_name (str): The file name, including the folder"""
+
+    extension = export_formats[file_format]
+    existing_names = set(os.listdir(folder)) if os.path.isdir(folder) else set()
+
+    file_name = f"{base_name}{extension}"
+    counter = 0
+    if file_name in existing_names:
+        # Only names taken by earlier exports are skipped, so this usually stops straight away
+        counter = 1
+        while f"{base_name} ({counter}){extension}" in existing_names:
+            counter += 1
+        file_name = f"{base_name} ({counter}){extension}"
+
+    return os.path.join(folder, file_name)
+
+
+def extract_timestamped_data(raw_data):
+    """Extracts the timestamps and values from a nested dictionary, keeping the values as their text
+
+    Parameters:
+    raw_data (dict): A nested dictionary returned by get_live_data_from_api
+
+    Returns:
+    timestamps (np.ndarray): The datetime64 timestamp of every reading
+    texts (list): The value of every reading as text, empty if it is missing"""
+
+    elements = raw_data["RawAQData"]["Data"]
+
+    timestamps = np.array([element['@MeasurementDateGMT'] for element in elements], dtype="datetime64[s]")
+    texts = [element['@Value'] for element in elements]
+
+    return timestamps, texts
+
+
+def align_series(columns):
+    """Lines up several series on one axis of every timestamp any of them has
+
+    Parameters:
+    columns (dict): (timestamps, texts) from extract_timestamped_data for every column name
+
+    Returns:
+    timestamps (np.ndarray): The sorted datetime64 timestamps
+    texts (dict): The text of every column's values, empty where it has no reading
+    values (dict): A float array of every column's values, NaN where it has no reading"""
+
+    timestamps = np.unique(np.concatenate([column[0] for column in columns.values()]
+                                          or [np.empty(0, dtype="datetime64[s]")]))
+
+    texts = {}
+    values = {}
+    for column_name, (column_timestamps, column_texts) in columns.items():
+        rows = np.searchsorted(timestamps, column_timestamps)
+
+        column_text = np.full(len(timestamps), "", dtype=object)
+        column_text[rows] = column_texts
+        texts[column_name] = column_text
+
+        column_values = np.full(len(timestamps), np.nan)
+        column_values[rows] = [float(text) if text else np.nan for text in column_texts]
+        values[column_name] = column_values
+
+    return timestamps, texts, values
+
+
+def write_atomically(file_name, write):
+    """Writes a file through a temporary file in the same folder which is then renamed over it
+
+    Parameters:
+    file_name (str): The file being written to
+    write (function): Writes the data, given the temporary file's name"""
+
+    folder = os.path.dirname(file_name) or "."
+    descriptor, temp_name = tempfile.mkstemp(dir=folder, prefix=".export-", suffix=".tmp")
+    os.close(descriptor)
+
+    try:
+        write(temp_name)
+        # mkstemp only lets the owner read the file, so it's given the permissions a new file normally gets
+        os.chmod(temp_name, 0o666 & ~get_umask())
+        os.replace(temp_name, file_name)
+    except BaseException:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+def get_umask():
+    """Returns the process's umask, which can only be read by setting it
+
+    Returns:
+    umask (int): The permission bits removed from new files"""
+
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def write_csv_export(file_name, file_format, timestamps, texts):
+    """Writes an export as a CSV file, optionally compressed, in batches of export_batch_rows
+
+    Parameters:
+    file_name (str): The file being written to
+    file_format (str): 'csv', 'csv.gz' or 'csv.zst'
+    timestamps (np.ndarray): The timestamp of every row
+    texts (dict): The text of every column's values"""
+
+    if file_format == "csv.zst" and zstandard is None:
+        raise Exception("The zstandard package is needed to export zstd compressed files")
+
+    timestamp_texts = np.datetime_as_string(timestamps, unit="m")
+    dates = [timestamp[:10] for timestamp in timestamp_texts]
+    times = [timestamp[11:] for timestamp in timestamp_texts]
+
+    with open(file_name, 'wb') as raw_file:
+        if file_format == "csv.gz":
+            f = gzip.GzipFile(fileobj=raw_file, mode='wb')
+        elif file_format == "csv.zst":
+            f = zstandard.ZstdCompressor().stream_writer(raw_file, closefd=False)
+        else:
+            f = raw_file
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["date", "time", *texts])
+
+        for start in range(0, len(timestamps), export_batch_rows):
+            stop = start + export_batch_rows
+            writer.writerows(zip(dates[start:stop], times[start:stop],
+                                 *(column[start:stop] for column in texts.values())))
+
+            f.write(buffer.getvalue().encode())
+            buffer.seek(0)
+            buffer.truncate()
+
+        # The header is still in the buffer when there were no rows
+        f.write(buffer.getvalue().encode())
+
+        if f is not raw_file:
+            f.close()
+
+
+def write_parquet_export(file_name, timestamps, values):
+    """Writes an export as a Parquet file, which needs pyarrow or fastparquet installed
+
+    Parameters:
+    file_name (str): The file being written to
+    timestamps (np.ndarray): The timestamp of every row
+    values (dict): The float values of every column"""
+
+    df = pd.DataFrame({"time": timestamps, **values})
+
+    try:
+        df.to_parquet(file_name, index=False)
+    except ImportError:
+        raise Exception("The pyarrow or fastparquet package is needed to export Parquet files")
+
+
+def write_numpy_export(file_name, file_format, timestamps, values):
+    """Writes an export as a NumPy file, a structured array for 'npy' or one array per column for 'npz'
+
+    Parameters:
+    file_name (str): The file being written to
+    file_format (str): 'npy' or 'npz'
+    timestamps (np.ndarray): The timestamp of every row
+    values (dict): The float values of every column"""
+
+    with open(file_name, 'wb') as f:
+        if file_format == "npz":
+            np.savez_compressed(f, time=timestamps, **values)
+            return
+
+        table = np.empty(len(timestamps), dtype=[("time", "datetime64[s]")] + [(name, "f8") for name in values])
+        table["time"] = timestamps
+        for column_name, column_values in values.items():
+            table[column_name] = column_values
+
+        np.save(f, table)
+
+
 def file_exists(name):
     """Checks if a file exists with the given name
 
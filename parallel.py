@@ -0,0 +1,247 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import catalogue
+import profiling
+import reporting
+import utils
+
+# Partial aggregates the workers can compute, each merged in time order once every chunk is done
+aggregates = ("statistics", "digest", "daily")
+
+# The values of every series, attached once per worker process by attach_shared_values
+worker_state = {
+    "memory": None,
+    "values": None
+}
+
+
+@profiling.profiled
+def parallel_aggregate(data, aggregate="statistics", stations=None, pollutants=None, chunk_days=30,
+                       workers=None, backend="process", percentiles=(50, 95, 98), compression=100):
+    """Calculates an aggregate for many stations and pollutants at once, split into chunks of time spread
+    across a pool of processes. The values are put in shared memory once, so the workers only receive the
+    position of their chunk rather than a copy of the data
+
+    Parameters:
+    data (dict): Contains the dataframes or StationData of every station
+    aggregate (str): 'statistics' (the same as reporting.summary_statistics), 'digest' (t-digest estimates of
+                     percentiles) or 'daily' (the same as reporting.daily_average), default is 'statistics'
+    stations (list): The stations being aggregated, default is None for every station in data
+    pollutants (list): The pollutants being aggregated, default is None for every pollutant in the catalogue
+    chunk_days (int): The number of days of values in each chunk, default is 30
+    workers (int): The number of processes, default is None for the number of CPUs
+    backend (str): 'process' to use a process pool or 'serial' to run every chunk in this process,
+                   default is 'process'
+    percentiles (tuple): The percentiles estimated by 'digest', default is (50, 95, 98)
+    compression (int): The compression of the t-digests, default is 100
+
+    Returns:
+    results (dict): The aggregate of every pollutant of every station, e.g. results['Harlington']['pm10']"""
+
+    if aggregate not in aggregates:
+        raise Exception("Invalid aggregate passed")
+    if backend not in ("process", "serial"):
+        raise Exception("Invalid backend passed")
+
+    stations = list(data) if stations is None else stations
+    pollutants = catalogue.pollutant_names() if pollutants is None else pollutants
+    series = [(station, pollutant) for station in stations for pollutant in pollutants]
+
+    # Series of different lengths are padded with NaN, which every aggregate counts as missing data
+    columns = [reporting.get_pollutant_values(data[station], pollutant) for station, pollutant in series]
+    length = max((len(column) for column in columns), default=0)
+
+    chunk_hours = chunk_days * 24
+    tasks = [(series_index, start, min(start + chunk_hours, len(column)))
+             for series_index, column in enumerate(columns) for start in range(0, len(column), chunk_hours)]
+
+    if backend == "serial" or workers == 1:
+        worker_state["values"] = np.full((len(series), length), np.nan)
+        for series_index, column in enumerate(columns):
+            worker_state["values"][series_index, :len(column)] = column
+
+        partials = [aggregate_chunk(task, aggregate, compression) for task in tasks]
+        worker_state["values"] = None
+    else:
+        partials = run_process_pool(columns, length, tasks, aggregate, compression, workers)
+
+    profiling.add_count("chunks", len(tasks))
+
+    # Partial aggregates are merged in time order for each series
+    merged = {}
+    for (series_index, start, stop), partial in sorted(zip(tasks, partials), key=lambda x: x[0][:2]):
+        if series_index not in merged:
+            merged[series_index] = partial
+        else:
+            merged[series_index] = merge_partials(merged[series_index], partial, aggregate)
+
+    results = {}
+    for series_index, (station, pollutant) in enumerate(series):
+        partial = merged.get(series_index, create_partial(aggregate, compression))
+        results.setdefault(station, {})[pollutant] = finish_partial(partial, aggregate, percentiles)
+
+    return results
+
+
+# My functions
+
+def run_process_pool(columns, length, tasks, aggregate, compression, workers=None):
+    """Copies the values into shared memory and aggregates every chunk with a pool of processes
+
+    Parameters:
+    columns (list): The values of every series
+    length (int): The length of the longest series
+    tasks (list): (series index, start, stop) of every chunk
+    aggregate (str): Any of the aggregates
+    compression (int): The compression of the t-digests
+    workers (int): The number of processes, default is None for the number of CPUs
+
+    Returns:
+    partials (list): The partial aggregate of every task, in the same order"""
+
+    shape = (len(columns), length)
+    memory = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        values[:] = np.nan
+        for series_index, column in enumerate(columns):
+            values[series_index, :len(column)] = column
+
+        # Each worker gets a share of the chunks at a time, rather than one chunk per message
+        workers = workers or os.cpu_count() or 1
+        batch_size = max(1, len(tasks) // (workers * 4))
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_shared_values,
+                                 initargs=(memory.name, shape)) as executor:
+            partials = list(executor.map(aggregate_chunk, tasks, [aggregate] * len(tasks),
+                                         [compression] * len(tasks), chunksize=batch_size))
+
+        del values
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return partials
+
+
+def attach_shared_values(memory_name, shape):
+    """Attaches a worker process to the shared values, once when it starts
+
+    Parameters:
+    memory_name (str): The name of the shared memory block
+    shape (tuple): The (series, hours) shape of the values"""
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+
+    worker_state["memory"] = memory
+    worker_state["values"] = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def aggregate_chunk(task, aggregate, compression=100):
+    """Calculates the partial aggregate of one chunk of a series from the shared values
+
+    Parameters:
+    task (tuple): The (series index, start, stop) of the chunk
+    aggregate (str): Any of the aggregates
+    compression (int): The compression of the t-digests, default is 100
+
+    Returns:
+    partial: The chunk's partial aggregate"""
+
+    series_index, start, stop = task
+    chunk = worker_state["values"][series_index, start:stop]
+
+    if aggregate == "statistics":
+        return utils.update_statistics(utils.create_statistics(), chunk, start)
+
+    if aggregate == "digest":
+        return utils.update_digest(utils.create_digest(compression), chunk)
+
+    # Whole days only, a partial day at the end is left out the same as daily_average
+    day_values = chunk[:len(chunk) // 24 * 24].reshape(-1, 24)
+    present = ~np.isnan(day_values)
+    partial = {
+        # Summed left to right like the reporting loops, so rounding matches daily_average exactly
+        "sums": np.cumsum(np.where(present, day_values, 0), axis=1)[:, -1],
+        "counts": present.sum(axis=1)
+    }
+    return partial
+
+
+def create_partial(aggregate, compression=100):
+    """Creates an empty partial aggregate, for series without any values
+
+    Parameters:
+    aggregate (str): Any of the aggregates
+    compression (int): The compression of the t-digests, default is 100
+
+    Returns:
+    partial: The empty partial aggregate"""
+
+    if aggregate == "statistics":
+        return utils.create_statistics()
+    if aggregate == "digest":
+        return utils.create_digest(compression)
+
+    partial = {"sums": np.empty(0), "counts": np.empty(0, dtype=int)}
+    return partial
+
+
+def merge_partials(first, second, aggregate):
+    """Merges the partial aggregates of two chunks, second following on from first
+
+    Parameters:
+    first: The partial aggregate of the earlier chunk
+    second: The partial aggregate of the later chunk
+    aggregate (str): Any of the aggregates
+
+    Returns:
+    merged: The partial aggregate of both chunks"""
+
+    if aggregate == "statistics":
+        return utils.merge_statistics(first, second)
+    if aggregate == "digest":
+        return utils.merge_digests(first, second)
+
+    merged = {
+        "sums": np.concatenate((first["sums"], second["sums"])),
+        "counts": np.concatenate((first["counts"], second["counts"]))
+    }
+    return merged
+
+
+def finish_partial(partial, aggregate, percentiles=(50, 95, 98)):
+    """Turns a series' merged partial aggregate into its result, rounded the same as the reporting functions
+
+    Parameters:
+    partial: The merged partial aggregate
+    aggregate (str): Any of the aggregates
+    percentiles (tuple): The percentiles estimated by 'digest', default is (50, 95, 98)
+
+    Returns:
+    result: The statistics dict, the percentiles dict (e.g. result['p95']) or the list of daily averages"""
+
+    decimal_places = reporting.decimal_places
+
+    if aggregate == "statistics":
+        statistics = utils.get_statistics(partial)
+        for key in ("sum", "mean", "min", "max", "variance"):
+            statistics[key] = round(statistics[key], decimal_places)
+        return statistics
+
+    if aggregate == "digest":
+        estimates = {f"p{percentile:g}": utils.digest_percentile(partial, percentile)
+                     for percentile in percentiles}
+        rounded_estimates = {key: "No data" if value == -1 else round(value, decimal_places)
+                             for key, value in estimates.items()}
+        return rounded_estimates
+
+    daily_averages = np.where(partial["counts"] > 0, partial["sums"] / np.maximum(partial["counts"], 1), -1)
+
+    rounded_daily_averages = utils.round_list(daily_averages.tolist(), decimal_places)
+    # -1 indicates there was no data available
+    rounded_daily_averages = utils.replace_list_value(rounded_daily_averages, -1, "No data")
+    return rounded_daily_averages
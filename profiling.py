@@ -0,0 +1,177 @@
+import time
+import json
+import os
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# Nothing is recorded until enable_profiling is called, so the decorated functions only pay for one check
+profiling_enabled = False
+
+# Totals for every measured name, e.g. 'reporting.daily_average'
+records = {}
+
+# Every measurement, in the Chrome trace event format
+trace_events = []
+
+profiling_lock = threading.Lock()
+active_measurements = threading.local()
+profiling_start = time.perf_counter()
+
+
+def enable_profiling(enabled=True):
+    """Turns recording of timings and counts on or off
+
+    Parameters:
+    enabled (bool): Whether to record, default is True"""
+
+    global profiling_enabled
+    profiling_enabled = enabled
+
+
+def reset_profiling():
+    """Clears everything recorded so far"""
+
+    global profiling_start
+
+    with profiling_lock:
+        records.clear()
+        trace_events.clear()
+        profiling_start = time.perf_counter()
+
+
+def profiled(function):
+    """Decorator which records the wall time and call count of a function while profiling is enabled
+
+    Parameters:
+    function (function): The function being measured
+
+    Returns:
+    wrapper (function): The measured function"""
+
+    name = f"{function.__module__}.{function.__qualname__}"
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not profiling_enabled:
+            return function(*args, **kwargs)
+
+        with measure(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def measure(name):
+    """Context manager which records the wall time of a block of code while profiling is enabled
+
+    Parameters:
+    name (str): The name the time is recorded under"""
+
+    if not profiling_enabled:
+        yield
+        return
+
+    stack = get_measurement_stack()
+    counts = {}
+    stack.append(counts)
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        record_measurement(name, start, duration, counts)
+
+
+def add_count(key, amount=1):
+    """Adds to a count, e.g. of rows, pixels or bytes, for the innermost measurement running on this thread
+
+    Parameters:
+    key (str): The name of the count, e.g. 'rows'
+    amount (int): How much to add, default is 1"""
+
+    if not profiling_enabled:
+        return
+
+    stack = get_measurement_stack()
+    if stack:
+        stack[-1][key] = stack[-1].get(key, 0) + amount
+
+
+def profiling_report():
+    """Summarises everything recorded, slowest total time first
+
+    Returns:
+    report (str): A table of the calls, total, mean and max time and counts of every measured name"""
+
+    with profiling_lock:
+        rows = sorted(records.items(), key=lambda x: x[1]["total_time"], reverse=True)
+
+    report = f"\n {'Name':45} {'Calls':>7} {'Total (s)':>10} {'Mean (ms)':>10} {'Max (ms)':>10}  Counts\n"
+    for name, record in rows:
+        counts = ", ".join(f"{key}={value}" for key, value in record["counts"].items())
+        report += (f" {name:45} {record['calls']:7} {record['total_time']:10.3f} "
+                   f"{record['total_time'] / record['calls'] * 1000:10.2f} {record['max_time'] * 1000:10.2f}  "
+                   f"{counts}\n")
+
+    return report
+
+
+def export_trace(file_name):
+    """Writes everything recorded as a Chrome trace event file, which can be opened with chrome://tracing,
+    Perfetto (ui.perfetto.dev) or speedscope
+
+    Parameters:
+    file_name (str): The file being written to"""
+
+    with profiling_lock:
+        trace = {"traceEvents": list(trace_events), "displayTimeUnit": "ms"}
+
+    with open(file_name, 'w') as f:
+        json.dump(trace, f)
+
+
+# My functions
+
+def get_measurement_stack():
+    """Returns the counts of the measurements running on this thread, innermost last
+
+    Returns:
+    stack (list): Contains a dict of counts for each running measurement"""
+
+    if not hasattr(active_measurements, "stack"):
+        active_measurements.stack = []
+
+    return active_measurements.stack
+
+
+def record_measurement(name, start, duration, counts):
+    """Adds a finished measurement to the totals and the trace
+
+    Parameters:
+    name (str): The name the time is recorded under
+    start (float): When the measurement started, from time.perf_counter
+    duration (float): How long the measurement took in seconds
+    counts (dict): The counts added during the measurement"""
+
+    with profiling_lock:
+        record = records.setdefault(name, {"calls": 0, "total_time": 0.0, "max_time": 0.0, "counts": {}})
+        record["calls"] += 1
+        record["total_time"] += duration
+        record["max_time"] = max(record["max_time"], duration)
+        for key, amount in counts.items():
+            record["counts"][key] = record["counts"].get(key, 0) + amount
+
+        # Complete events, with times in microseconds
+        trace_events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - profiling_start) * 1e6,
+            "dur": duration * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": counts
+        })
@@ -1,9 +1,24 @@
 import numpy as np
+import pandas as pd
+import os
+import json
+import hashlib
+import warnings
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+import catalogue
+import monitoring
+import profiling
+import store
 import utils
 
 decimal_places = 3
 
+# Where build_event_index saves the exceedance events of every station
+event_index_file = "data/exceedance-index.json"
 
+
+@profiling.profiled
 def daily_average(data, monitoring_station, pollutant):
     """Calculates the average for every day over the year 2021 for a given pollutant and station
 
@@ -29,7 +44,7 @@ def daily_average(data, monitoring_station, pollutant):
             df_table_index = (day * 24) + hour
             hour_measurement = read_df_entry(df, df_table_index, pollutant)
 
-            if hour_measurement == "No data":
+            if is_missing_value(hour_measurement):
                 continue
             day_measurements.append(hour_measurement)
 
@@ -48,6 +63,7 @@ def daily_average(data, monitoring_station, pollutant):
     return rounded_daily_averages
 
 
+@profiling.profiled
 def daily_median(data, monitoring_station, pollutant):
     """Calculates the median for every day over the year 2021 for a given pollutant and station
 
@@ -59,34 +75,19 @@ def daily_median(data, monitoring_station, pollutant):
     Returns:
     rounded_daily_medians (list): Contains all the calculated values"""
 
-    daily_medians = []
-    df = data[monitoring_station]
+    values = get_pollutant_values(data[monitoring_station], pollutant)
 
     # If program were to be modified for different years,
     # support for leap years would need to be added
-    for day in range(365):
-
-        hourly_measurements = []
-        for hour in range(24):
+    day_values = values[:365 * 24].reshape(365, 24)
 
-            # Appending the hourly measurements to hourly_measurements
-            df_table_index = (day * 24) + hour
-            hour_measurement = read_df_entry(df, df_table_index, pollutant)
+    # Every day's median is selected at once, days without data give NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        daily_medians = np.nanmedian(day_values, axis=1)
 
-            if hour_measurement == "No data":
-                continue
-            hourly_measurements.append(hour_measurement)
-
-        hourly_measurements = utils.convert_list_type(hourly_measurements, "float")
-
-        if utils.is_empty(hourly_measurements):
-            daily_median = -1
-        else:
-            # Converting to numpy array
-            hourly_measurements = np.array(hourly_measurements)
-            daily_median = np.median(hourly_measurements)
-
-        daily_medians.append(daily_median)
+    # Kept as np.float64 items, which round the same way as the medians of the original loop
+    daily_medians = list(np.where(np.isnan(daily_medians), -1, daily_medians))
 
     rounded_daily_medians = utils.round_list(daily_medians, decimal_places)
     # -1 indicates there was no data available
@@ -94,6 +95,7 @@ def daily_median(data, monitoring_station, pollutant):
     return rounded_daily_medians
 
 
+@profiling.profiled
 def hourly_average(data, monitoring_station, pollutant):
     """Calculates the average for every hour of the day over the year 2021 for a given pollutant and station
 
@@ -105,37 +107,13 @@ def hourly_average(data, monitoring_station, pollutant):
     Returns:
     rounded_hourly_averages (list): Contains all the calculated values"""
 
-    hourly_averages = []
-    df = data[monitoring_station]
-
-    for hour in range(24):
-
-        hour_measurements = []
-        for day in range(365):
-            df_table_index = (day * 24) + hour
-
-            day_measurement_for_hour = read_df_entry(df, df_table_index, pollutant)
-
-            if day_measurement_for_hour == "No data":
-                continue
-            hour_measurements.append(day_measurement_for_hour)
-
-        hour_measurements = utils.convert_list_type(hour_measurements, "float")
-
-        if utils.is_empty(hour_measurements):
-            hourly_mean = -1
-        else:
-            hourly_mean = utils.meannvalue(hour_measurements)
-
-        hourly_averages.append(hourly_mean)
-
-    rounded_hourly_averages = utils.round_list(hourly_averages, decimal_places)
-    # -1 indicates there was no data available
-    rounded_hourly_averages = utils.replace_list_value(rounded_hourly_averages, -1, "No data")
+    # Taken from the cached day by hour profiles rather than reading the rows again
+    rounded_hourly_averages = hourly_profiles(data, monitoring_station, pollutant)["hourly"]
 
     return rounded_hourly_averages
 
 
+@profiling.profiled
 def monthly_average(data, monitoring_station, pollutant):
     """Calculates the average for every month over the year 2021 for a given pollutant and station
 
@@ -164,7 +142,7 @@ def monthly_average(data, monitoring_station, pollutant):
                 hour_measurement = read_df_entry(df, df_table_index, pollutant)
                 df_table_index += 1
 
-                if hour_measurement == "No data":
+                if is_missing_value(hour_measurement):
                     continue
                 month_measurements.append(hour_measurement)
 
@@ -184,6 +162,7 @@ def monthly_average(data, monitoring_station, pollutant):
     return rounded_monthly_averages
 
 
+@profiling.profiled
 def peak_hour_date(data, date, monitoring_station, pollutant):
     """Calculates the greatest value and the hour it was recorded for a given date (in 2021), pollutant and station
 
@@ -206,7 +185,7 @@ def peak_hour_date(data, date, monitoring_station, pollutant):
     for df_index, hour in enumerate(range(24), df_index):
         hour_measurement = read_df_entry(df, df_index, pollutant)
 
-        if hour_measurement == "No data":
+        if is_missing_value(hour_measurement):
             continue
         hourly_measurements.append(hour_measurement)
 
@@ -225,6 +204,7 @@ def peak_hour_date(data, date, monitoring_station, pollutant):
     return output
 
 
+@profiling.profiled
 def count_missing_data(data, monitoring_station, pollutant):
     """Calculates the number of missing data entries over the year 2021 for a given pollutant and station
 
@@ -237,19 +217,15 @@ def count_missing_data(data, monitoring_station, pollutant):
     count (int): Contains the number of missing data entries"""
 
     df = data[monitoring_station]
-    count = 0
 
-    # Iterates through whole dataframe for the column
-    for index in range(24 * 365):
-
-        # Check if the current entry data is "No data"
-        entry_data = read_df_entry(df, index, pollutant)
-        if entry_data == "No data":
-            count += 1
+    # Counts the set bits of the column's missing data bitmap
+    bitmap = get_missing_bitmap(df, pollutant)
+    count = popcount(bitmap)
 
     return count
 
 
+@profiling.profiled
 def fill_missing_data(data, new_value, monitoring_station, pollutant):
     """replacing every instance of missing data in the CSV with the value given, for a given pollutant and station
 
@@ -263,23 +239,621 @@ def fill_missing_data(data, new_value, monitoring_station, pollutant):
     data (dict): Contains the relevant data to be analysed"""
 
     df = data[monitoring_station]
+    normalise_missing_data(df, pollutant)
+
+    # Only the missing entries of the one column are written to, in place
+    bitmap = get_missing_bitmap(df, pollutant)
+    missing = np.unpackbits(bitmap, count=len(df)).astype(bool)
 
-    # If condition is met for a cell, the value is changed to new_value
-    condition = (df == "No data") & (df.columns == pollutant)
-    df = df.mask(condition, new_value)
+    if isinstance(df, store.StationData):
+        store.set_values(df, pollutant, np.where(missing, new_value, store.get_values(df, pollutant)))
+    else:
+        df.loc[missing, pollutant] = new_value
 
     data[monitoring_station] = df
 
     return data
 
 
+@profiling.profiled
+def impute_missing_data(data, monitoring_station, pollutant, methods=("linear",), new_value=None, max_gap=None,
+                        window_days=7):
+    """Fills missing data for a given pollutant and station using one or more strategies, in the order given.
+    Later strategies only fill what the earlier ones couldn't
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    methods (tuple): Any of 'linear' (between neighbouring readings), 'time' (between neighbouring readings by
+                     their timestamps), 'seasonal' (the mean of the same hour on nearby days), 'station' (from the
+                     most correlated other station) and 'constant' (new_value), default is ('linear',)
+    new_value (float): Used by the 'constant' strategy, default is None
+    max_gap (int): The longest gap in hours 'linear' and 'time' will fill, default is None for any length
+    window_days (int): How many days either side 'seasonal' uses, default is 7
+
+    Returns:
+    data (dict): Contains the relevant data to be analysed
+    fill_counts (dict): The number of values each strategy filled"""
+
+    df = data[monitoring_station]
+    normalise_missing_data(df, pollutant)
+    values = get_pollutant_values(df, pollutant).copy()
+
+    fill_counts = {}
+    for method in methods:
+        missing = np.isnan(values)
+
+        if method == "linear":
+            filled = interpolate_gaps(values, np.arange(len(values)), max_gap)
+        elif method == "time":
+            filled = interpolate_gaps(values, get_time_hours(df), max_gap)
+        elif method == "seasonal":
+            filled = seasonal_fill(values, window_days)
+        elif method == "station":
+            filled = station_fill(data, monitoring_station, pollutant, values)
+        elif method == "constant":
+            if new_value is None:
+                raise Exception("A new value is needed for the constant strategy")
+            filled = np.where(missing, new_value, values)
+        else:
+            raise Exception("Invalid imputation method passed")
+
+        fill_counts[method] = int(np.count_nonzero(missing & ~np.isnan(filled)))
+        values = filled
+
+    # Only the one column is written to, in place
+    if isinstance(df, store.StationData):
+        store.set_values(df, pollutant, values)
+    else:
+        df[pollutant] = values
+
+    data[monitoring_station] = df
+
+    return data, fill_counts
+
+
+@profiling.profiled
+def rolling_average(data, monitoring_station, pollutant, window_hours=8, min_coverage=0.75):
+    """Calculates the running mean ending at every hour of 2021 for a given pollutant and station
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    window_hours (int): The length of the window in hours, e.g. 8 or 24, default is 8
+    min_coverage (float): The fraction of the window which must have data, default is 0.75
+
+    Returns:
+    rounded_rolling_averages (list): Contains all the calculated values"""
+
+    values = get_pollutant_values(data[monitoring_station], pollutant)
+    rolling_averages = rolling_mean(values, window_hours, min_coverage)
+
+    rounded_rolling_averages = [round(element, decimal_places) for element in rolling_averages.tolist()]
+    # NaN indicates there wasn't enough data in the window
+    rounded_rolling_averages = ["No data" if element != element else element for element in rounded_rolling_averages]
+    return rounded_rolling_averages
+
+
+@profiling.profiled
+def count_exceedances(data, monitoring_station, pollutant, threshold, window_hours=8, min_coverage=0.75,
+                      per_day=False):
+    """Counts how often the running mean exceeded a threshold over the year 2021 for a given pollutant and station
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    threshold (float): The value the running mean must be above to count as an exceedance
+    window_hours (int): The length of the window in hours, default is 8
+    min_coverage (float): The fraction of the window which must have data, default is 0.75
+    per_day (bool): Counts days with at least one exceedance instead of hours, default is False
+
+    Returns:
+    count (int): Contains the number of exceedances"""
+
+    values = get_pollutant_values(data[monitoring_station], pollutant)
+    exceeded = rolling_mean(values, window_hours, min_coverage) > threshold
+
+    if per_day:
+        # If program were to be modified for different years,
+        # support for leap years would need to be added
+        exceeded = exceeded[:365 * 24].reshape(365, 24).any(axis=1)
+
+    count = int(np.count_nonzero(exceeded))
+    return count
+
+
+@profiling.profiled
+def summary_statistics(data, monitoring_station, pollutant):
+    """Calculates the descriptive statistics over the year 2021 for a given pollutant and station in one pass
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+
+    Returns:
+    statistics (dict): Contains the count, sum, mean, min, max, variance and missing count, along with the
+                       row indexes of the min and max"""
+
+    df = data[monitoring_station]
+
+    # A StationData keeps its statistics up to date as readings are appended
+    if isinstance(df, store.StationData):
+        statistics = store.get_statistics(df, pollutant)
+    else:
+        statistics = utils.describe_values(get_pollutant_values(df, pollutant))
+
+    for key in ("sum", "mean", "min", "max", "variance"):
+        statistics[key] = round(statistics[key], decimal_places)
+
+    return statistics
+
+
+@profiling.profiled
+def period_percentiles(data, monitoring_station, pollutant, percentile=50, period="month", exact=True,
+                       compression=100):
+    """Calculates a percentile (e.g. the median, P95 or P98) for every day, month or the whole of 2021 for a
+    given pollutant and station
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    percentile (float): The percentile being calculated, between 0 and 100, default is 50
+    period (str): 'day', 'month' or 'year', default is 'month'
+    exact (bool): Uses exact selection, otherwise merges a bounded-memory t-digest of each day, default is True
+    compression (int): The compression of the t-digests when not exact, default is 100
+
+    Returns:
+    rounded_percentiles (list): Contains all the calculated values"""
+
+    values = get_pollutant_values(data[monitoring_station], pollutant)
+
+    # If program were to be modified for different years,
+    # support for leap years would need to be added
+    days_in_months = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+    if period == "day":
+        period_days = (1,) * 365
+    elif period == "month":
+        period_days = days_in_months
+    elif period == "year":
+        period_days = (365,)
+    else:
+        raise Exception("Invalid period passed")
+
+    percentiles = []
+    day = 0
+    for number_of_days in period_days:
+        period_values = values[day * 24:(day + number_of_days) * 24]
+        day += number_of_days
+
+        if exact:
+            percentiles.append(utils.exact_percentile(period_values, percentile))
+            continue
+
+        # Only one day of values is digested at a time, the digests are merged for longer periods
+        digest = utils.create_digest(compression)
+        for day_values in period_values.reshape(number_of_days, 24):
+            digest = utils.merge_digests(digest, utils.update_digest(utils.create_digest(compression), day_values))
+        percentiles.append(utils.digest_percentile(digest, percentile))
+
+    rounded_percentiles = utils.round_list(percentiles, decimal_places)
+    # -1 indicates there was no data available
+    rounded_percentiles = utils.replace_list_value(rounded_percentiles, -1, "No data")
+    return rounded_percentiles
+
+
+@profiling.profiled
+def backtest_warnings(data, monitoring_station, pollutant, bands=None):
+    """Scores every hour of 2021 against the warning bands for a given pollutant and station
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    bands (tuple): (threshold, level) pairs to test instead of the catalogue's warning bands, default is None
+
+    Returns:
+    level_counts (dict): Maps each warning level to the number of hours it would have been raised for"""
+
+    values = get_pollutant_values(data[monitoring_station], pollutant)
+    levels = monitoring.evaluate_warning_levels(pollutant.upper(), values, bands)
+
+    # Level -1 (no warning) is not counted
+    counts = np.bincount(levels[levels >= 0], minlength=4)
+    level_counts = {level: int(count) for level, count in enumerate(counts)}
+
+    return level_counts
+
+
+@profiling.profiled
+def build_station_matrix(data, stations=None, pollutants=None):
+    """Aligns the data of several stations on one time axis as a time x station x pollutant array
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    stations (list): The stations included, default is None for every station in the catalogue which is in data
+    pollutants (list): The pollutants included, default is None for every pollutant in the catalogue
+
+    Returns:
+    matrix (dict): Contains the hours since 1970-01-01 of each row, the station and pollutant names of the other
+                   two axes and the values, with missing data as NaN"""
+
+    if stations is None:
+        stations = tuple(station for station in catalogue.station_names() if station in data)
+    else:
+        stations = tuple(stations)
+    pollutants = catalogue.pollutant_names() if pollutants is None else tuple(pollutants)
+
+    station_hours = [get_time_hours(data[station]) for station in stations]
+
+    # Stations usually cover the same hours, otherwise every station is placed on the union of their hours
+    if all(np.array_equal(hours, station_hours[0]) for hours in station_hours):
+        hours = station_hours[0]
+    else:
+        hours = np.unique(np.concatenate(station_hours))
+
+    values = np.full((len(hours), len(stations), len(pollutants)), np.nan)
+    for station_number, station in enumerate(stations):
+        rows = np.searchsorted(hours, station_hours[station_number])
+        for pollutant_number, pollutant in enumerate(pollutants):
+            values[rows, station_number, pollutant_number] = get_pollutant_values(data[station], pollutant)
+
+    matrix = {"hours": hours, "stations": stations, "pollutants": pollutants, "values": values}
+    return matrix
+
+
+@profiling.profiled
+def station_correlations(matrix, pollutant):
+    """Calculates the correlation of a pollutant between every pair of stations at once, using the hours where
+    both stations have data
+
+    Parameters:
+    matrix (dict): The aligned data from build_station_matrix
+    pollutant (str): The pollutant being compared
+
+    Returns:
+    correlations (np.ndarray): A station x station array of Pearson correlations, NaN where a pair has too
+                               little data in common"""
+
+    values = matrix["values"][:, :, matrix["pollutants"].index(pollutant)]
+    present = (~np.isnan(values)).astype(float)
+    filled = np.where(present == 1, values, 0.0)
+
+    # Sums over the hours both stations of each pair have data, as matrix products
+    pair_counts = present.T @ present
+    pair_sums = filled.T @ present
+    pair_square_sums = np.square(filled).T @ present
+    pair_product_sums = filled.T @ filled
+
+    covariances = pair_counts * pair_product_sums - pair_sums * pair_sums.T
+    variances = pair_counts * pair_square_sums - np.square(pair_sums)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlations = covariances / np.sqrt(variances * variances.T)
+
+    correlations[pair_counts < 2] = np.nan
+    return correlations
+
+
+def station_difference(matrix, first_station, second_station, pollutant):
+    """Calculates the hourly difference of a pollutant between two stations
+
+    Parameters:
+    matrix (dict): The aligned data from build_station_matrix
+    first_station (str): The station being subtracted from
+    second_station (str): The station being subtracted
+    pollutant (str): The pollutant being compared
+
+    Returns:
+    differences (np.ndarray): The first station's values minus the second's, NaN where either is missing"""
+
+    pollutant_number = matrix["pollutants"].index(pollutant)
+    first_values = matrix["values"][:, matrix["stations"].index(first_station), pollutant_number]
+    second_values = matrix["values"][:, matrix["stations"].index(second_station), pollutant_number]
+
+    differences = first_values - second_values
+    return differences
+
+
+@profiling.profiled
+def rank_stations(matrix, pollutant, period="hour"):
+    """Ranks the stations by a pollutant for every hour or day, 1 being the highest
+
+    Parameters:
+    matrix (dict): The aligned data from build_station_matrix
+    pollutant (str): The pollutant being ranked
+    period (str): 'hour' or 'day', days are ranked by their means, default is 'hour'
+
+    Returns:
+    ranks (np.ndarray): A period x station array of ranks, NaN where a station has no data"""
+
+    values = matrix["values"][:, :, matrix["pollutants"].index(pollutant)]
+
+    if period == "day":
+        number_of_days = len(values) // 24
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            values = np.nanmean(values[:number_of_days * 24].reshape(number_of_days, 24, -1), axis=1)
+    elif period != "hour":
+        raise Exception("Invalid period passed")
+
+    # Sorting the negated values puts the highest first and the missing values last
+    order = np.argsort(np.where(np.isnan(values), np.inf, -values), axis=1, kind="stable")
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, np.arange(1, values.shape[1] + 1, dtype=float)[np.newaxis, :], axis=1)
+
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+
+@profiling.profiled
+def query_range(data, monitoring_station, pollutant, start=None, end=None, interval="day", statistic="mean"):
+    """Calculates a statistic for every interval between two times for a given pollutant and station, only
+    reading the rows in the range
+
+    Parameters:
+    data (dict): Contains all the relevant data
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    start (str): The first date or hour included, e.g. '2021-03-01' or '2021-03-01 06:00', default is None for
+                 the first row
+    end (str): The first date or hour not included, e.g. '2021-04-01', default is None for after the last row
+    interval (str or int): 'hour', 'day', 'week' (starting on Mondays), 'month', 'year' or a number of hours
+                           counted from start, default is 'day'
+    statistic (str): 'mean', 'sum', 'min', 'max', 'count', 'median' or a percentile such as 'p95',
+                     default is 'mean'
+
+    Returns:
+    results (list): Contains a (period start, value) tuple for every interval with rows in the range"""
+
+    df = data[monitoring_station]
+    hours = get_time_hours(df)
+
+    # Rows are sorted by time, so the range is found by binary search and only its values are converted
+    first_row, last_row = find_hour_range(hours, start, end)
+    hours = hours[first_row:last_row]
+    values = get_pollutant_values(df, pollutant, first_row, last_row)
+
+    if not len(hours):
+        return []
+
+    # Each row is labelled with the start of its hour, the CSV files' 01:00:00 covering 00:00 to 01:00
+    period_starts, label_unit = get_period_starts(hours - 1, interval, start)
+    boundaries = np.flatnonzero(np.concatenate(([True], period_starts[1:] != period_starts[:-1])))
+
+    period_values = reduce_periods(values, boundaries, statistic)
+
+    labels = np.datetime_as_string(period_starts[boundaries], unit=label_unit)
+    labels = [label.replace("T", " ") for label in labels.tolist()]
+
+    if statistic != "count":
+        period_values = utils.round_list(period_values, decimal_places)
+        # -1 indicates there was no data available
+        period_values = utils.replace_list_value(period_values, -1, "No data")
+
+    results = list(zip(labels, period_values))
+    return results
+
+
+@profiling.profiled
+def hourly_profiles(data, monitoring_station, pollutant, trend_days=7):
+    """Calculates the hourly profiles and a trend/seasonal decomposition for a given pollutant and station.
+    The values are reshaped into a day by hour array once and every view is a reduction of it. For a
+    StationData they are cached until the pollutant's values change
+
+    Parameters:
+    data (dict): Contains all the relevant data
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    trend_days (int): The width in days of the centred moving average used as the trend, rounded up to an odd
+                      number, default is 7
+
+    Returns:
+    profiles (dict): Contains 'hourly', 'weekday' and 'weekend' (the average of every hour of the day),
+                     'month_hour' (the average of every hour of the day for each month), 'trend' (the trend of
+                     every day), 'seasonal' (the daily cycle around the trend) and 'residual_std' (the standard
+                     deviation of what's left), with "No data" where there was no data"""
+
+    df = data[monitoring_station]
+    cache = get_profile_cache(df).setdefault(pollutant, {})
+
+    if trend_days not in cache:
+        cache[trend_days] = calculate_profiles(df, pollutant, trend_days)
+    profile_values = cache[trend_days]
+
+    # Formatted on every call, so changing the returned lists doesn't change the cache
+    profiles = {
+        "hourly": format_profile(profile_values["hourly"]),
+        "weekday": format_profile(profile_values["weekday"]),
+        "weekend": format_profile(profile_values["weekend"]),
+        "month_hour": [format_profile(month) for month in profile_values["month_hour"]],
+        "trend": format_profile(profile_values["trend"]),
+        "seasonal": format_profile(profile_values["seasonal"]),
+        "residual_std": format_profile([profile_values["residual_std"]])[0]
+    }
+
+    return profiles
+
+
+@profiling.profiled
+def detect_exceedances(data, monitoring_station, pollutant, threshold=None, min_hours=1):
+    """Finds every episode where a pollutant stayed above a threshold for a number of consecutive hours,
+    using run-length encoding of the hours above it. Missing data ends an episode
+
+    Parameters:
+    data (dict): Contains all the relevant data
+    monitoring_station (str): Used to select the right section of data
+    pollutant (str): Used to select the right section of data
+    threshold (float): The value readings must be above, default is None for the pollutant's lowest warning band
+    min_hours (int): The fewest consecutive hours an episode lasts, default is 1
+
+    Returns:
+    events (list): Contains a dict of the start and end time, duration in hours, peak value and peak time
+                   of every episode, in time order"""
+
+    df = data[monitoring_station]
+    threshold = get_default_threshold(pollutant) if threshold is None else threshold
+
+    hours = get_time_hours(df)
+    values = get_pollutant_values(df, pollutant)
+    above = values > threshold
+
+    # Runs start and end where the hours above the threshold do, or where rows stop being consecutive
+    consecutive = np.diff(hours) == 1
+    previous_above = np.concatenate(([False], above[:-1] & consecutive))
+    next_above = np.concatenate((above[1:] & consecutive, [False]))
+
+    run_starts = np.flatnonzero(above & ~previous_above)
+    run_ends = np.flatnonzero(above & ~next_above) + 1
+
+    if not len(run_starts):
+        return []
+
+    # Each run's peak is the max from its start to the next run's start, the hours between runs being masked
+    masked = np.where(above, values, -np.inf)
+    peaks = np.maximum.reduceat(masked, run_starts)
+
+    rows = np.arange(run_starts[0], len(values))
+    row_runs = np.searchsorted(run_starts, rows, side="right") - 1
+    peak_candidates = rows[masked[rows] == peaks[row_runs]]
+    peak_rows = peak_candidates[np.unique(row_runs[peak_candidates - run_starts[0]], return_index=True)[1]]
+
+    long_enough = run_ends - run_starts >= min_hours
+    run_starts, run_ends = run_starts[long_enough], run_ends[long_enough]
+    peaks, peak_rows = peaks[long_enough], peak_rows[long_enough]
+
+    # Times are the start of each row's hour, so an event ends when its last hour does
+    events = [{
+        "start": format_hour(hours[start] - 1),
+        "end": format_hour(hours[end - 1]),
+        "duration": int(end - start),
+        "peak": round(float(peak), decimal_places),
+        "peak_time": format_hour(hours[peak_row] - 1)
+    } for start, end, peak, peak_row in zip(run_starts, run_ends, peaks, peak_rows)]
+
+    return events
+
+
+@profiling.profiled
+def build_event_index(data, thresholds=None, min_hours=1, file_name=event_index_file):
+    """Detects the exceedance events of every station and pollutant and saves them, so later queries only look
+    them up
+
+    Parameters:
+    data (dict): Contains all the relevant data
+    thresholds (dict): The threshold of every pollutant, default is None for each one's lowest warning band
+    min_hours (int): The fewest consecutive hours an event lasts, default is 1
+    file_name (str): The JSON file the index is saved to, default is 'data/exceedance-index.json', None to
+                     not save it
+
+    Returns:
+    index (dict): Contains the parameters, a checksum of every station's hours and values, so a changed station
+                  can be noticed, and the events of every station and pollutant"""
+
+    thresholds = {} if thresholds is None else dict(thresholds)
+    for pollutant in catalogue.pollutant_names():
+        thresholds.setdefault(pollutant, get_default_threshold(pollutant))
+
+    index = {
+        "thresholds": thresholds,
+        "min_hours": min_hours,
+        "stations": {}
+    }
+
+    for station, df in data.items():
+        station_index = {"checksum": get_data_checksum(df, thresholds), "events": {}}
+
+        for pollutant, threshold in thresholds.items():
+            events = detect_exceedances(data, station, pollutant, threshold, min_hours)
+
+            # The start and end hours are sorted, so time ranges are found with binary search
+            station_index["events"][pollutant] = {
+                "events": events,
+                "start_hours": [int(np.datetime64(event["start"], "h").astype(np.int64)) for event in events],
+                "end_hours": [int(np.datetime64(event["end"], "h").astype(np.int64)) for event in events]
+            }
+
+        index["stations"][station] = station_index
+
+    if file_name is not None:
+        with open(file_name, 'w') as f:
+            json.dump(index, f)
+
+    return index
+
+
+def load_event_index(data, thresholds=None, min_hours=1, file_name=event_index_file):
+    """Loads the saved exceedance events, rebuilding them if the file is missing, was built with different
+    parameters or any station's data has changed since, including values imputed or corrected in place
+
+    Parameters:
+    data (dict): Contains all the relevant data
+    thresholds (dict): The threshold of every pollutant, default is None for each one's lowest warning band
+    min_hours (int): The fewest consecutive hours an event lasts, default is 1
+    file_name (str): The JSON file the index is saved to, default is 'data/exceedance-index.json'
+
+    Returns:
+    index (dict): The same as build_event_index"""
+
+    wanted_thresholds = {pollutant: get_default_threshold(pollutant) for pollutant in catalogue.pollutant_names()}
+    wanted_thresholds.update(thresholds or {})
+
+    index = None
+    if os.path.exists(file_name):
+        with open(file_name) as f:
+            index = json.load(f)
+
+    def is_current(station, station_index):
+        return station_index.get("checksum") == get_data_checksum(data[station], wanted_thresholds)
+
+    if index is None or index["thresholds"] != wanted_thresholds or index["min_hours"] != min_hours or \
+            set(index["stations"]) != set(data) or \
+            not all(is_current(station, station_index) for station, station_index in index["stations"].items()):
+        index = build_event_index(data, wanted_thresholds, min_hours, file_name)
+
+    return index
+
+
+def find_events(index, monitoring_station, pollutant, start=None, end=None, min_hours=None):
+    """Looks up the exceedance events overlapping a time range in an event index
+
+    Parameters:
+    index (dict): From build_event_index or load_event_index
+    monitoring_station (str): The station
+    pollutant (str): The pollutant
+    start (str): The start of the range, e.g. '2021-01-01', default is None for the first event
+    end (str): The end of the range, not included, default is None for after the last event
+    min_hours (int): Only events lasting at least this many hours, default is None for all of them
+
+    Returns:
+    events (list): The events overlapping the range, in time order"""
+
+    series = index["stations"][monitoring_station]["events"][pollutant]
+
+    # Events never overlap, so both their starts and ends are in order
+    first = 0 if start is None else bisect_right(series["end_hours"],
+                                                 int(np.datetime64(start, "h").astype(np.int64)))
+    last = len(series["events"]) if end is None else bisect_left(series["start_hours"],
+                                                                 int(np.datetime64(end, "h").astype(np.int64)))
+
+    events = series["events"][first:last]
+    if min_hours is not None:
+        events = [event for event in events if event["duration"] >= min_hours]
+
+    return events
+
+
 # My functions
 
 def find_df_index(df, term, column):
     """Finds the index of a given term in a pandas dataframe
 
     Parameters:
-    df (pandas dataframe): The dataframe being searched
+    df (pandas dataframe or store.StationData): The dataframe being searched
     term (str): The term being searched for
     column (str): The column being searched
 
@@ -287,6 +861,9 @@ def find_df_index(df, term, column):
     index: Returns the index of the search term
     -1: Returns -1 if the term cannot be found in the dataframe"""
 
+    if isinstance(df, store.StationData):
+        return store.find_row(df, term, column)
+
     for index, entry_data in enumerate(df[column]):
 
         if entry_data == term:
@@ -299,12 +876,629 @@ def read_df_entry(df, df_table_index, pollutant):
     """Reads a dataframe entry for a given index and pollutant (column)
 
     Parameters:
-    df (pandas dataframe): The dataframe being searched
+    df (pandas dataframe or store.StationData): The dataframe being searched
     df_table_index (int): The index of entry being read
     pollutant (str): The column of the entry being read
 
     Returns:
     df_entry (str): Contains the dataframe entry being searched for"""
 
+    if isinstance(df, store.StationData):
+        return store.read_value(df, df_table_index, pollutant)
+
+    profiling.add_count("rows")
+
     df_entry = df.loc[df_table_index, pollutant]
     return df_entry
+
+
+def get_pollutant_values(df, pollutant, first_row=0, last_row=None):
+    """Reads a pollutant column of a dataframe as floats, with missing data as NaN
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The dataframe being read
+    pollutant (str): The column being read
+    first_row (int): The first row read, default is 0
+    last_row (int): The row after the last row read, default is None for every row to the end
+
+    Returns:
+    values (np.ndarray): Contains the column's values as floats"""
+
+    if isinstance(df, store.StationData):
+        return store.get_values(df, pollutant, first_row, last_row)
+
+    column = df[pollutant].iloc[first_row:last_row]
+    profiling.add_count("rows", len(column))
+
+    # Columns from load_station_data are already floats, so aren't copied
+    if column.dtype.kind == "f":
+        return column.to_numpy()
+
+    values = pd.to_numeric(column, errors="coerce").to_numpy(dtype=float)
+    return values
+
+
+def get_data_checksum(df, pollutants):
+    """Hashes the hours and values of a station, so any change to them can be noticed
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The station's data
+    pollutants (list): The pollutants included, in order
+
+    Returns:
+    checksum (str): The hex digest of the hours and every pollutant's values"""
+
+    digest = hashlib.sha1(np.ascontiguousarray(get_time_hours(df), dtype=np.int64).tobytes())
+    for pollutant in pollutants:
+        digest.update(pollutant.encode())
+        digest.update(np.ascontiguousarray(get_pollutant_values(df, pollutant), dtype=np.float64).tobytes())
+
+    checksum = digest.hexdigest()
+    return checksum
+
+
+def get_time_hours(df):
+    """Converts the date and time columns of a dataframe to hours since 1970-01-01, the CSV files' 24:00:00
+    being the last hour of a day
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The dataframe being read
+
+    Returns:
+    hours (np.ndarray): An int64 array of the hour of every row"""
+
+    if isinstance(df, store.StationData):
+        return df.hours
+
+    days = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    hours = days * 24 + df["time"].str.slice(0, 2).astype(np.int64).to_numpy()
+    return hours
+
+
+def calculate_profiles(df, pollutant, trend_days=7):
+    """Reshapes a pollutant's values into a day by hour array and reduces it to every profile
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The station's data
+    pollutant (str): The pollutant
+    trend_days (int): The width in days of the trend's centred moving average, default is 7
+
+    Returns:
+    profile_values (dict): The unrounded profiles as float arrays, NaN where there was no data"""
+
+    values = get_pollutant_values(df, pollutant)
+    number_of_days = len(values) // 24
+
+    # A partial day at the end is left out
+    day_values = values[:number_of_days * 24].reshape(number_of_days, 24)
+    days = (get_time_hours(df)[:number_of_days * 24:24] - 1) // 24
+
+    present = ~np.isnan(day_values)
+    filled = np.where(present, day_values, 0)
+
+    def hour_means(selected_days):
+        # Summed day by day like the reporting loops, so rounding matches them exactly
+        counts = present[selected_days].sum(axis=0)
+        if not counts.any():
+            return np.full(24, np.nan)
+
+        sums = np.cumsum(filled[selected_days], axis=0)[-1]
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    # 1970-01-01 was a Thursday, so day 0 is weekday 3 counting from Monday
+    weekday = (days + 3) % 7 < 5
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) % 12
+
+    # The trend is a centred moving average of the daily means, shortened at the ends
+    day_counts = present.sum(axis=1)
+    day_means = np.where(day_counts > 0, filled.sum(axis=1) / np.maximum(day_counts, 1), np.nan)
+
+    half_window = trend_days // 2
+    day_present = ~np.isnan(day_means)
+    sums = np.concatenate(([0], np.cumsum(np.where(day_present, day_means, 0))))
+    counts = np.concatenate(([0], np.cumsum(day_present)))
+    window_starts = np.clip(np.arange(number_of_days) - half_window, 0, number_of_days)
+    window_ends = np.clip(np.arange(number_of_days) + half_window + 1, 0, number_of_days)
+    window_counts = counts[window_ends] - counts[window_starts]
+    trend = np.where(window_counts > 0, (sums[window_ends] - sums[window_starts]) / np.maximum(window_counts, 1),
+                     np.nan)
+
+    # The seasonal part is the average daily cycle around the trend, centred on zero
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        detrended = day_values - trend[:, None]
+        seasonal = np.nanmean(detrended, axis=0)
+        seasonal -= np.nanmean(seasonal)
+        residual_std = np.sqrt(np.nanmean(np.square(detrended - seasonal)))
+
+    profile_values = {
+        "hourly": hour_means(np.ones(number_of_days, dtype=bool)),
+        "weekday": hour_means(weekday),
+        "weekend": hour_means(~weekday),
+        "month_hour": np.array([hour_means(months == month) for month in range(12)]),
+        "trend": trend,
+        "seasonal": seasonal,
+        "residual_std": residual_std
+    }
+
+    return profile_values
+
+
+def get_profile_cache(df):
+    """Returns where a station's hourly profiles are cached. Only a StationData keeps them, as it clears them
+    whenever its values change, a dataframe can be sliced or written to directly so gets a new empty cache
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The station's data
+
+    Returns:
+    cache (dict): The cached profiles of every pollutant"""
+
+    if isinstance(df, store.StationData):
+        return df.profiles
+
+    cache = {}
+    return cache
+
+
+def get_default_threshold(pollutant):
+    """Returns the lowest warning band threshold of a pollutant, used when finding exceedances
+
+    Parameters:
+    pollutant (str): The name of the pollutant, e.g. 'pm10'
+
+    Returns:
+    threshold (float): The threshold"""
+
+    threshold = catalogue.get_pollutant(pollutant)["warning_bands"][0][0]
+    return threshold
+
+
+def format_hour(hour):
+    """Writes an hour since 1970-01-01 as a time, e.g. '2021-03-01 05:00'
+
+    Parameters:
+    hour (int): The hour
+
+    Returns:
+    time (str): The formatted time"""
+
+    time = str(np.datetime64(int(hour), "h").astype("datetime64[m]")).replace("T", " ")
+    return time
+
+
+def format_profile(values):
+    """Rounds a profile, with NaN as "No data"
+
+    Parameters:
+    values (np.ndarray): The profile's values
+
+    Returns:
+    rounded_values (list): Contains the rounded values"""
+
+    rounded_values = ["No data" if value != value else round(value, decimal_places)
+                      for value in np.asarray(values, dtype=float).tolist()]
+    return rounded_values
+
+
+def find_hour_range(hours, start=None, end=None):
+    """Finds the rows between two times using binary search on the sorted hours
+
+    Parameters:
+    hours (np.ndarray): The hour of every row, from get_time_hours
+    start (str): The first date or hour included, default is None for the first row
+    end (str): The first date or hour not included, default is None for after the last row
+
+    Returns:
+    first_row (int): The index of the first row in the range
+    last_row (int): The index after the last row in the range"""
+
+    # A row's hour is the end of the hour it covers, so the row covering start is at start + 1
+    first_row = 0
+    if start is not None:
+        start_hour = np.datetime64(start, "h").astype(np.int64)
+        first_row = int(np.searchsorted(hours, start_hour + 1))
+
+    last_row = len(hours)
+    if end is not None:
+        end_hour = np.datetime64(end, "h").astype(np.int64)
+        last_row = int(np.searchsorted(hours, end_hour + 1))
+
+    return first_row, max(first_row, last_row)
+
+
+def get_period_starts(hour_starts, interval, start=None):
+    """Labels every row with the start of the interval it is in
+
+    Parameters:
+    hour_starts (np.ndarray): The start of every row's hour, in hours since 1970-01-01
+    interval (str or int): 'hour', 'day', 'week', 'month', 'year' or a number of hours
+    start (str): Where intervals given as a number of hours are counted from, default is None for the first row
+
+    Returns:
+    period_starts (np.ndarray): A datetime64 array of the start of every row's interval
+    label_unit (str): The datetime unit the labels are written in, e.g. 'D' for '2021-03-01'"""
+
+    row_starts = hour_starts.astype("datetime64[h]")
+
+    if interval == "hour":
+        return row_starts, "m"
+    if interval == "day":
+        return row_starts.astype("datetime64[D]"), "D"
+    if interval == "week":
+        days = row_starts.astype("datetime64[D]")
+        # 1970-01-01 was a Thursday, 3 days after a Monday
+        return days - (days.astype(np.int64) + 3) % 7, "D"
+    if interval == "month":
+        return row_starts.astype("datetime64[M]"), "M"
+    if interval == "year":
+        return row_starts.astype("datetime64[Y]"), "Y"
+
+    try:
+        interval_hours = int(str(interval).rstrip("h"))
+    except ValueError:
+        raise Exception("Invalid interval passed")
+    if interval_hours < 1:
+        raise Exception("Invalid interval passed")
+
+    origin = hour_starts[0] if start is None else np.datetime64(start, "h").astype(np.int64)
+    period_starts = origin + (hour_starts - origin) // interval_hours * interval_hours
+    return period_starts.astype("datetime64[h]"), "m"
+
+
+def reduce_periods(values, boundaries, statistic):
+    """Calculates a statistic for every run of values between boundaries, with NaN counted as missing data
+
+    Parameters:
+    values (np.ndarray): The values, with the values of each period next to each other
+    boundaries (np.ndarray): The index of the first value of every period
+    statistic (str): 'mean', 'sum', 'min', 'max', 'count', 'median' or a percentile such as 'p95'
+
+    Returns:
+    results (list): The statistic of every period, -1 for periods without data"""
+
+    present = ~np.isnan(values)
+    counts = np.add.reduceat(present, boundaries)
+
+    if statistic == "count":
+        return counts.tolist()
+
+    if statistic in ("mean", "sum"):
+        sums = np.add.reduceat(np.where(present, values, 0), boundaries)
+        results = sums / np.maximum(counts, 1) if statistic == "mean" else sums
+    elif statistic == "min":
+        results = np.fmin.reduceat(values, boundaries)
+    elif statistic == "max":
+        results = np.fmax.reduceat(values, boundaries)
+    elif statistic == "median" or (statistic.startswith("p") and statistic[1:].replace(".", "", 1).isdigit()):
+        percentile = 50 if statistic == "median" else float(statistic[1:])
+        if percentile > 100:
+            raise Exception("Invalid statistic passed")
+
+        ends = np.append(boundaries[1:], len(values))
+        results = np.array([utils.exact_percentile(values[first:last], percentile)
+                            for first, last in zip(boundaries, ends)])
+    else:
+        raise Exception("Invalid statistic passed")
+
+    results = np.where(counts > 0, results, -1).tolist()
+    return results
+
+
+def interpolate_gaps(values, positions, max_gap=None):
+    """Linearly interpolates the missing values between the readings either side of each gap
+
+    Parameters:
+    values (np.ndarray): The values, with missing data as NaN
+    positions (np.ndarray): The position of every value, e.g. its index or its time
+    max_gap (int): Gaps with more missing values than this are left, default is None for any length
+
+    Returns:
+    filled (np.ndarray): A copy of values with the gaps filled"""
+
+    missing = np.isnan(values)
+    filled = values.copy()
+
+    if missing.all() or not missing.any():
+        return filled
+
+    present = ~missing
+    interpolated = np.interp(positions[missing], positions[present], values[present])
+
+    # np.interp repeats the edge values past the first and last reading, which aren't gaps
+    first_present, last_present = np.nonzero(present)[0][[0, -1]]
+    missing_indexes = np.nonzero(missing)[0]
+    inside = (missing_indexes > first_present) & (missing_indexes < last_present)
+
+    if max_gap is not None:
+        inside &= get_gap_lengths(missing)[missing_indexes] <= max_gap
+
+    filled[missing_indexes[inside]] = interpolated[inside]
+    return filled
+
+
+def get_gap_lengths(missing):
+    """Finds the length of the run of missing values every value belongs to, using run-length encoding
+
+    Parameters:
+    missing (np.ndarray): A bool array of which values are missing
+
+    Returns:
+    lengths (np.ndarray): The length of each value's run, 0 for values which aren't missing"""
+
+    # Run boundaries are where missing changes
+    changes = np.flatnonzero(np.diff(missing.astype(np.int8))) + 1
+    starts = np.concatenate(([0], changes))
+    run_lengths = np.diff(np.concatenate((starts, [len(missing)])))
+
+    lengths = np.repeat(run_lengths, run_lengths)
+    lengths[~missing] = 0
+    return lengths
+
+
+def seasonal_fill(values, window_days=7):
+    """Fills missing values with the mean of the same hour of the day on the days either side
+
+    Parameters:
+    values (np.ndarray): Hourly values starting at the first hour of a day, with missing data as NaN
+    window_days (int): How many days either side are used
+
+    Returns:
+    filled (np.ndarray): A copy of values with the gaps filled where nearby days had data"""
+
+    number_of_days = len(values) // 24
+    day_values = values[:number_of_days * 24].reshape(number_of_days, 24)
+    present = ~np.isnan(day_values)
+
+    # Centred window sums over days for every hour at once, using cumulative sums
+    sums = np.vstack((np.zeros(24), np.cumsum(np.where(present, day_values, 0.0), axis=0)))
+    counts = np.vstack((np.zeros(24), np.cumsum(present, axis=0)))
+
+    days = np.arange(number_of_days)
+    window_starts = np.maximum(days - window_days, 0)
+    window_ends = np.minimum(days + window_days + 1, number_of_days)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = (sums[window_ends] - sums[window_starts]) / (counts[window_ends] - counts[window_starts])
+
+    filled = values.copy()
+    filled[:number_of_days * 24] = np.where(present, day_values, means).ravel()
+    return filled
+
+
+def station_fill(data, monitoring_station, pollutant, values):
+    """Fills missing values from the other station whose readings correlate best, scaled with a linear fit and
+    clamped at 0
+
+    Parameters:
+    data (dict): Contains all the relevant data for 2021
+    monitoring_station (str): The station being filled
+    pollutant (str): The pollutant being filled
+    values (np.ndarray): The values being filled, with missing data as NaN
+
+    Returns:
+    filled (np.ndarray): A copy of values with the gaps filled where the other station had data"""
+
+    best_correlation = 0
+    best_fit = None
+
+    for station, df in data.items():
+        if station == monitoring_station:
+            continue
+
+        other_values = get_pollutant_values(df, pollutant)
+        if len(other_values) != len(values):
+            continue
+
+        overlap = ~np.isnan(values) & ~np.isnan(other_values)
+        if np.count_nonzero(overlap) < 2:
+            continue
+
+        correlation = np.corrcoef(other_values[overlap], values[overlap])[0, 1]
+        if correlation > best_correlation:
+            best_correlation = correlation
+            slope, intercept = np.polyfit(other_values[overlap], values[overlap], 1)
+            best_fit = (other_values, slope, intercept)
+
+    filled = values.copy()
+    if best_fit is None:
+        return filled
+
+    other_values, slope, intercept = best_fit
+    missing = np.isnan(values)
+    # The fit's intercept can take low readings below zero, which isn't a possible concentration
+    filled[missing] = np.maximum(intercept + slope * other_values[missing], 0)
+    return filled
+
+
+@profiling.profiled
+def load_station_data(file_name):
+    """Reads a station's CSV file with the "No data" entries as NaN, so the pollutant columns are floats
+
+    Parameters:
+    file_name (str): The file name of the CSV file
+
+    Returns:
+    df (pandas dataframe): Contains the station's data"""
+
+    df = pd.read_csv(file_name, na_values=["No data"])
+    profiling.add_count("rows", len(df))
+    profiling.add_count("bytes_read", os.path.getsize(file_name))
+    return df
+
+
+def normalise_missing_data(df, pollutant):
+    """Converts a pollutant column still using "No data" strings to floats with NaN, in place
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The dataframe being converted
+    pollutant (str): The column being converted"""
+
+    # A StationData's values are always floats
+    if isinstance(df, store.StationData):
+        return
+
+    if df[pollutant].dtype.kind != "f":
+        df[pollutant] = get_pollutant_values(df, pollutant)
+
+
+def get_missing_bitmap(df, pollutant):
+    """Returns a bitmap of a column's missing entries. A StationData keeps its bitmaps up to date as its values
+    change, a dataframe's is built on every call as it can be sliced or written to directly
+
+    Parameters:
+    df (pandas dataframe or store.StationData): The dataframe being checked
+    pollutant (str): The column being checked
+
+    Returns:
+    bitmap (np.ndarray): The missing entries packed 8 per byte, see np.packbits"""
+
+    if isinstance(df, store.StationData):
+        return df.missing[pollutant]
+
+    bitmap = np.packbits(np.isnan(get_pollutant_values(df, pollutant)))
+    return bitmap
+
+
+def popcount(bitmap):
+    """Counts the set bits of a bitmap
+
+    Parameters:
+    bitmap (np.ndarray): A uint8 array
+
+    Returns:
+    count (int): The number of set bits"""
+
+    # np.bitwise_count was added in NumPy 2.0
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(bitmap).sum())
+
+    count = int(np.unpackbits(bitmap).sum())
+    return count
+
+
+def is_missing_value(value):
+    """Checks if a dataframe entry is missing data, either NaN or the "No data" string of the CSV files
+
+    Parameters:
+    value: The dataframe entry
+
+    Returns:
+    missing (bool): Whether the entry is missing data"""
+
+    missing = value != value or value == "No data"
+    return missing
+
+
+def rolling_mean(values, window, min_coverage=0.75):
+    """Calculates the running mean of the window ending at every index in one pass using cumulative sums.
+    Also works on the live feed, e.g. values from a monitoring window
+
+    Parameters:
+    values (np.ndarray): The values, with missing data as NaN
+    window (int): The number of values in each window
+    min_coverage (float): The fraction of the window which must have data, default is 0.75
+
+    Returns:
+    means (np.ndarray): The running means, NaN where there wasn't enough data"""
+
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+
+    # Prefix sums of the values and of how many values are present
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+
+    window_ends = np.arange(1, len(values) + 1)
+    window_starts = np.maximum(window_ends - window, 0)
+    window_sums = sums[window_ends] - sums[window_starts]
+    window_counts = counts[window_ends] - counts[window_starts]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = window_sums / window_counts
+
+    means[window_counts < max(1, np.ceil(min_coverage * window))] = np.nan
+    return means
+
+
+def rolling_max(values, window, min_coverage=0.75):
+    """Calculates the running maximum of the window ending at every index in one pass using a monotonic deque
+
+    Parameters:
+    values (np.ndarray): The values, with missing data as NaN
+    window (int): The number of values in each window
+    min_coverage (float): The fraction of the window which must have data, default is 0.75
+
+    Returns:
+    maxima (np.ndarray): The running maxima, NaN where there wasn't enough data"""
+
+    values = np.asarray(values, dtype=float)
+    maxima = np.full(len(values), np.nan)
+    min_count = max(1, np.ceil(min_coverage * window))
+
+    # Holds indexes whose values are in decreasing order, so the front is always the window maximum
+    candidates = deque()
+    count = 0
+
+    for index, value in enumerate(values.tolist()):
+
+        # Removing the value leaving the window
+        if index >= window and values[index - window] == values[index - window]:
+            count -= 1
+        if candidates and candidates[0] <= index - window:
+            candidates.popleft()
+
+        if value == value:
+            count += 1
+            while candidates and values[candidates[-1]] <= value:
+                candidates.pop()
+            candidates.append(index)
+
+        if count >= min_count:
+            maxima[index] = values[candidates[0]]
+
+    return maxima
+
+
+def rolling_percentile(values, window, percentile, min_coverage=0.75):
+    """Calculates a running percentile of the window ending at every index in one pass, keeping the window
+    sorted as values enter and leave it
+
+    Parameters:
+    values (np.ndarray): The values, with missing data as NaN
+    window (int): The number of values in each window
+    percentile (float): The percentile being calculated, between 0 and 100
+    min_coverage (float): The fraction of the window which must have data, default is 0.75
+
+    Returns:
+    percentiles (np.ndarray): The running percentiles (linearly interpolated), NaN where there wasn't enough data"""
+
+    values = np.asarray(values, dtype=float)
+    values_list = values.tolist()
+    percentiles = np.full(len(values), np.nan)
+    min_count = max(1, np.ceil(min_coverage * window))
+
+    sorted_window = []
+
+    for index, value in enumerate(values_list):
+
+        # Removing the value leaving the window
+        if index >= window:
+            old_value = values_list[index - window]
+            if old_value == old_value:
+                del sorted_window[bisect_left(sorted_window, old_value)]
+
+        if value == value:
+            insort(sorted_window, value)
+
+        count = len(sorted_window)
+        if count < min_count:
+            continue
+
+        # Linear interpolation between the closest ranks, the same as np.percentile
+        rank = (count - 1) * percentile / 100
+        lower = int(rank)
+        upper = min(lower + 1, count - 1)
+        percentiles[index] = sorted_window[lower] + (sorted_window[upper] - sorted_window[lower]) * (rank - lower)
+
+    return percentiles
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+import catalogue
+import intelligence
+import monitoring
+import reporting
+import store
+
+# Reporting functions which can be queried, with the types of their extra query parameters
+reporting_endpoints = {
+    "daily_average": {},
+    "daily_median": {},
+    "hourly_average": {},
+    "hourly_profiles": {"trend_days": int},
+    "monthly_average": {},
+    "peak_hour_date": {"date": str},
+    "count_missing_data": {},
+    "rolling_average": {"window_hours": int, "min_coverage": float},
+    "count_exceedances": {"threshold": float, "window_hours": int, "min_coverage": float},
+    "summary_statistics": {},
+    "period_percentiles": {"percentile": float, "period": str, "exact": lambda x: x.lower() == "true"},
+    "backtest_warnings": {},
+    "query_range": {"start": str, "end": str, "interval": str, "statistic": str},
+    "detect_exceedances": {"threshold": float, "min_hours": int}
+}
+
+# Live results are only reused for this many seconds, the historical data never changes while serving
+monitoring_cache_seconds = 60
+
+# The most results kept in the cache, the least recently used being dropped first
+cache_size = 1000
+
+# Colours whose components can be queried, with the intelligence function finding their pixels
+component_colours = {
+    "red": intelligence.find_red_pixels,
+    "cyan": intelligence.find_cyan_pixels
+}
+
+# Shared by every request, so the data and results stay in memory between requests
+server_state = {
+    "data": None,
+    "cache": OrderedDict(),
+    "latencies": {},
+    "pending": {},
+    "components": {},
+    "executor": None,
+    # Requests are answered on several threads, so the cache and component labelling take turns
+    "cache_lock": threading.Lock(),
+    "components_lock": threading.Lock()
+}
+
+
+def load_server_data():
+    """Reads every station's data from the catalogue, so requests don't need to"""
+
+    server_state["data"] = {station: store.load_station_store(catalogue.station_file(station))
+                            for station in catalogue.station_names()}
+    with server_state["cache_lock"]:
+        server_state["cache"].clear()
+
+
+async def handle_connection(reader, writer):
+    """Answers one HTTP request, computing results on a worker thread so other requests carry on meanwhile
+
+    Parameters:
+    reader (asyncio.StreamReader): Reads the request
+    writer (asyncio.StreamWriter): Writes the response"""
+
+    start = time.perf_counter()
+    endpoint = "invalid"
+
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+
+        # Skipping the headers, the server doesn't use them
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+
+        if len(request_line) < 2 or request_line[0] != "GET":
+            status, body = 405, {"error": "Only GET requests are supported"}
+        else:
+            url = urlsplit(request_line[1])
+            endpoint = url.path
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            # Identical requests arriving together share one computation instead of each starting their own
+            key = (endpoint, tuple(sorted(query.items())))
+            pending = server_state["pending"].get(key)
+            if pending is None:
+                loop = asyncio.get_running_loop()
+                pending = loop.run_in_executor(server_state["executor"], answer_request, endpoint, query)
+                server_state["pending"][key] = pending
+                pending.add_done_callback(lambda _: server_state["pending"].pop(key, None))
+
+            status, body = await asyncio.shield(pending)
+
+    except (ConnectionError, UnicodeDecodeError):
+        writer.close()
+        return
+
+    if not isinstance(body, bytes):
+        body = json.dumps(body, default=convert_json_value).encode()
+
+    writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode() + body)
+
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+    # Unknown paths are grouped so the latencies table stays small
+    endpoint = endpoint if status != 404 else "not found"
+    server_state["latencies"].setdefault(endpoint, deque(maxlen=1000)).append(time.perf_counter() - start)
+
+
+def answer_request(endpoint, query):
+    """Works out the response to a request, using the cache where possible
+
+    Parameters:
+    endpoint (str): The path of the request, e.g. '/reporting/daily_average'
+    query (dict): The query parameters of the request
+
+    Returns:
+    status (int): The HTTP status code
+    body (bytes or dict): The JSON response, already encoded if it came from the cache"""
+
+    if endpoint == "/metrics":
+        return 200, get_latency_metrics()
+
+    cache_key = (endpoint, tuple(sorted(query.items())))
+    with server_state["cache_lock"]:
+        cached = server_state["cache"].get(cache_key)
+        if cached is not None and (cached["expires"] is None or cached["expires"] > time.monotonic()):
+            server_state["cache"].move_to_end(cache_key)
+            return 200, cached["body"]
+
+    try:
+        result, cacheable_for = compute_result(endpoint, query)
+    except KeyError as error:
+        return 404 if error.args and error.args[0] == endpoint else 400, {"error": f"Unknown or missing {error}"}
+    except (ValueError, TypeError, FileNotFoundError) as error:
+        return 400, {"error": str(error)}
+    except Exception as error:
+        return 500, {"error": str(error)}
+
+    body = json.dumps(result, default=convert_json_value).encode()
+    expires = None if cacheable_for is None else time.monotonic() + cacheable_for
+    with server_state["cache_lock"]:
+        server_state["cache"][cache_key] = {"body": body, "expires": expires}
+        server_state["cache"].move_to_end(cache_key)
+        while len(server_state["cache"]) > cache_size:
+            server_state["cache"].popitem(last=False)
+
+    return 200, body
+
+
+def compute_result(endpoint, query):
+    """Calls the reporting, intelligence or monitoring function for an endpoint
+
+    Parameters:
+    endpoint (str): The path of the request
+    query (dict): The query parameters of the request
+
+    Returns:
+    result: The function's result, which can be converted to JSON
+    cacheable_for (float): How many seconds the result can be reused, None for as long as the server runs"""
+
+    parts = endpoint.strip("/").split("/")
+
+    if len(parts) == 2 and parts[0] == "reporting" and parts[1] in reporting_endpoints:
+        function = getattr(reporting, parts[1])
+        options = {name: convert(query[name]) for name, convert in reporting_endpoints[parts[1]].items()
+                   if name in query}
+
+        if parts[1] == "peak_hour_date":
+            result = function(server_state["data"], options["date"], query["station"], query["pollutant"])
+        else:
+            result = function(server_state["data"], query["station"], query["pollutant"], **options)
+        return result, None
+
+    if endpoint == "/monitoring/graph":
+        graph, complete = monitoring.pollutant_graph(query["station"], query["pollutant"], query["date"])
+        return {"graph": graph, "complete": complete}, monitoring_cache_seconds
+
+    if endpoint == "/monitoring/warnings":
+        return {"report": monitoring.pollutants_warning()}, monitoring_cache_seconds
+
+    if endpoint == "/monitoring/description":
+        return {"description": monitoring.pollutant_description(query["pollutant"])}, None
+
+    if endpoint == "/intelligence/components":
+        index = get_component_index(query.get("map", "map"), query.get("colour", "red"))
+        components = {label: component["pixels"] for label, component in index["components"].items()}
+        return {"components": components, "total": len(components)}, None
+
+    if endpoint == "/intelligence/region":
+        index = get_component_index(query.get("map", "map"), query.get("colour", "red"))
+        labels = intelligence.query_region(index, int(query["top"]), int(query["left"]), int(query["bottom"]),
+                                           int(query["right"]))
+        return {"components": [dict(index["components"][label], label=label) for label in labels]}, None
+
+    if endpoint == "/intelligence/nearest":
+        index = get_component_index(query.get("map", "map"), query.get("colour", "red"))
+        nearest = intelligence.nearest_components(index, float(query["y"]), float(query["x"]),
+                                                  int(query.get("count", 1)))
+        return {"components": [dict(index["components"][label], label=label, distance=distance)
+                               for label, distance in nearest]}, None
+
+    raise KeyError(endpoint)
+
+
+def get_component_index(map_name, colour):
+    """Labels a map's components once and keeps their spatial index for later region and nearest queries
+
+    Parameters:
+    map_name (str): The name of a .png map in the data folder without its extension, e.g. 'map'
+    colour (str): 'red' or 'cyan'
+
+    Returns:
+    index (dict): The spatial index from intelligence.detect_connected_components"""
+
+    # Only plain file names are allowed, so a query can't reach files outside the data folder
+    if not map_name or map_name.startswith(".") or os.path.basename(map_name) != map_name or \
+            (os.altsep and os.altsep in map_name):
+        raise ValueError(f"Invalid map name '{map_name}'")
+    if colour not in component_colours:
+        raise ValueError(f"Invalid colour '{colour}', expected one of {', '.join(component_colours)}")
+
+    key = (map_name, colour)
+
+    # The intelligence functions write their results to fixed files in the data folder, so only one map is
+    # labelled at a time
+    with server_state["components_lock"]:
+        if key not in server_state["components"]:
+            colour_map = component_colours[colour](os.path.join("data", f"{map_name}.png"))
+            MARK, index = intelligence.detect_connected_components(colour_map, verbose=False, return_index=True)
+            server_state["components"][key] = index
+
+    return server_state["components"][key]
+
+
+def get_latency_metrics():
+    """Summarises the latency of every endpoint
+
+    Returns:
+    metrics (dict): The number of requests and the mean, 50th, 95th and 99th percentile latency in milliseconds
+                    of every endpoint, over its most recent 1000 requests"""
+
+    metrics = {}
+    for endpoint, latencies in list(server_state["latencies"].items()):
+        milliseconds = np.array(latencies) * 1000
+        metrics[endpoint] = {
+            "requests": len(milliseconds),
+            "mean": float(milliseconds.mean()),
+            "p50": float(np.percentile(milliseconds, 50)),
+            "p95": float(np.percentile(milliseconds, 95)),
+            "p99": float(np.percentile(milliseconds, 99))
+        }
+
+    return metrics
+
+
+async def run_server(host="localhost", port=8080, workers=4):
+    """Loads the station data and serves requests until cancelled
+
+    Parameters:
+    host (str): The address to listen on, default is 'localhost'
+    port (int): The port to listen on, default is 8080
+    workers (int): The number of threads computing results, default is 4"""
+
+    load_server_data()
+    server_state["executor"] = ThreadPoolExecutor(max_workers=workers)
+
+    server = await asyncio.start_server(handle_connection, host, port)
+    print(f" Serving on http://{host}:{port}, press Ctrl+C to stop.")
+
+    async with server:
+        await server.serve_forever()
+
+
+# My functions
+
+def convert_json_value(value):
+    """Converts the NumPy values returned by the modules so they can be written as JSON
+
+    Parameters:
+    value: The value json.dumps couldn't convert
+
+    Returns:
+    value: A Python equivalent of the value"""
+
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    raise TypeError(f"Cannot convert {type(value).__name__} to JSON")
+
+
+if __name__ == '__main__':
+    # e.g. python server.py 8080 --offline
+    if "--offline" in sys.argv:
+        monitoring.set_data_source("csv")
+
+    port_arguments = [argument for argument in sys.argv[1:] if argument.isdigit()]
+
+    try:
+        asyncio.run(run_server(port=int(port_arguments[0]) if port_arguments else 8080))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,427 @@
+import os
+import csv
+import datetime
+import numpy as np
+import pandas as pd
+import catalogue
+import monitoring
+import profiling
+import utils
+
+# Checked in order, the fewest decimal places which recover every value exactly from float32 are used.
+# Pollutants needing more precision than float32 holds, e.g. 5 decimal places above 100, are kept as float64
+max_decimal_places = 6
+
+
+class StationData:
+    """A station's readings as arrays, using a fraction of the memory of a dataframe with string columns.
+    Use the functions below rather than the attributes directly
+
+    Attributes:
+    hours (np.ndarray): The int64 hour of every row since 1970-01-01, the CSV files' 24:00:00 being the last
+                        hour of a day
+    values (dict): The array of every pollutant in the CSV's column order, missing data as NaN, float32 unless
+                   that can't hold the values exactly
+    missing (dict): The missing entries of every pollutant packed 8 per byte, see np.packbits
+    decimals (dict): The decimal places every pollutant's values are rounded to when read, None to not round
+    statistics (dict): The utils.update_statistics accumulator of every pollutant, kept up to date on appends
+    profiles (dict): The cached reporting.hourly_profiles of every pollutant, cleared when its values change"""
+
+    __slots__ = ("hours", "values", "missing", "decimals", "statistics", "profiles")
+
+    def __init__(self, hours, pollutant_values):
+        self.hours = np.asarray(hours, dtype=np.int64)
+        self.values = {}
+        self.missing = {}
+        self.decimals = {}
+        self.statistics = {}
+        self.profiles = {}
+
+        for pollutant, values in pollutant_values.items():
+            set_values(self, pollutant, values)
+
+    def __len__(self):
+        return len(self.hours)
+
+
+@profiling.profiled
+def load_station_store(file_name):
+    """Reads a station's CSV file into a StationData
+
+    Parameters:
+    file_name (str): The file name of the CSV file
+
+    Returns:
+    station (StationData): Contains the station's data"""
+
+    df = pd.read_csv(file_name, na_values=["No data"])
+    profiling.add_count("rows", len(df))
+    profiling.add_count("bytes_read", os.path.getsize(file_name))
+
+    station = from_dataframe(df)
+    return station
+
+
+def from_dataframe(df):
+    """Converts a station's dataframe, as read from its CSV file, to a StationData
+
+    Parameters:
+    df (pandas dataframe): Contains 'date' and 'time' columns followed by the pollutant columns
+
+    Returns:
+    station (StationData): Contains the same data"""
+
+    days = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    hours = days * 24 + df["time"].str.slice(0, 2).astype(np.int64).to_numpy()
+
+    pollutant_values = {pollutant: pd.to_numeric(df[pollutant], errors="coerce").to_numpy(dtype=float)
+                        for pollutant in df.columns if pollutant not in ("date", "time")}
+
+    station = StationData(hours, pollutant_values)
+    return station
+
+
+def to_dataframe(station):
+    """Converts a StationData back to the dataframe layout of the CSV files, e.g. for printing or exporting
+
+    Parameters:
+    station (StationData): The station's data
+
+    Returns:
+    df (pandas dataframe): Contains 'date' and 'time' columns followed by the pollutant columns"""
+
+    # Moving 24:00:00 back to the day it ends
+    days, hours = np.divmod(station.hours - 1, 24)
+
+    df = pd.DataFrame({
+        "date": days.astype("datetime64[D]").astype(str),
+        "time": [f"{hour:02}:00:00" for hour in (hours + 1).tolist()]
+    })
+
+    for pollutant in station.values:
+        df[pollutant] = get_values(station, pollutant)
+
+    return df
+
+
+def get_values(station, pollutant, first_row=0, last_row=None):
+    """Reads a pollutant as float64, with missing data as NaN. Only the rows asked for are converted
+
+    Parameters:
+    station (StationData): The station's data
+    pollutant (str): The pollutant being read
+    first_row (int): The first row read, default is 0
+    last_row (int): The row after the last row read, default is None for every row to the end
+
+    Returns:
+    values (np.ndarray): A new float64 array of the pollutant's values"""
+
+    values = station.values[pollutant][first_row:last_row].astype(np.float64)
+    profiling.add_count("rows", len(values))
+
+    # Undoes the float32 rounding, so results match those of the CSV's values
+    if station.decimals[pollutant] is not None:
+        values = np.round(values, station.decimals[pollutant])
+
+    return values
+
+
+def set_values(station, pollutant, values):
+    """Replaces a whole pollutant's values, in place
+
+    Parameters:
+    station (StationData): The station's data
+    pollutant (str): The pollutant being written
+    values (np.ndarray): The new values, with missing data as NaN"""
+
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) != len(station.hours):
+        raise Exception("The number of values doesn't match the number of hours")
+
+    stored = values.astype(np.float32)
+    decimals = get_decimal_places(values, stored)
+
+    station.values[pollutant] = stored if decimals is not None else values.copy()
+    station.missing[pollutant] = np.packbits(np.isnan(values))
+    station.decimals[pollutant] = decimals
+    station.statistics[pollutant] = utils.update_statistics(utils.create_statistics(), values)
+    station.profiles.pop(pollutant, None)
+
+
+@profiling.profiled
+def append_readings(station, readings, file_name=None):
+    """Appends new hourly readings after a station's last hour, updating its arrays, missing data bitmaps and
+    statistics from the new rows only, and optionally its CSV file. Hours between the station's last hour and
+    the new readings are added as missing data, so rows stay one hour apart
+
+    Parameters:
+    station (StationData): The station's data, changed in place
+    readings (dict): (timestamp, value) tuples for any of the station's pollutants, as returned by
+                     monitoring.extract_new_readings, timestamps being the start of the hour in GMT
+    file_name (str): The station's CSV file the new rows are appended to, default is None to only update memory
+
+    Returns:
+    appended (int): The number of rows added"""
+
+    new_hours, new_values = validate_readings(station, readings)
+    if not len(new_hours):
+        return 0
+
+    offset = len(station.hours)
+    station.hours = np.concatenate((station.hours, new_hours))
+
+    for pollutant, values in new_values.items():
+        stored = values.astype(station.values[pollutant].dtype)
+
+        # The whole pollutant is stored again only if its new values need more precision
+        if station.decimals[pollutant] is not None and not is_recoverable(values, stored, station.decimals[pollutant]):
+            set_values(station, pollutant, np.concatenate((get_values(station, pollutant), values)))
+            continue
+
+        missing = np.unpackbits(station.missing[pollutant], count=offset).astype(bool)
+
+        station.values[pollutant] = np.concatenate((station.values[pollutant], stored))
+        station.missing[pollutant] = np.packbits(np.concatenate((missing, np.isnan(values))))
+        station.statistics[pollutant] = utils.update_statistics(station.statistics[pollutant], values, offset)
+        station.profiles.pop(pollutant, None)
+
+    if file_name is not None:
+        append_to_csv(file_name, new_hours, new_values)
+
+    appended = len(new_hours)
+    profiling.add_count("rows", appended)
+    return appended
+
+
+def ingest_live_data(station, station_name, start_date, end_date, file_name=None):
+    """Fetches every pollutant of a station from the LondonAir API and appends the readings newer than the
+    station's last hour
+
+    Parameters:
+    station (StationData): The station's data, changed in place
+    station_name (str): The name of the station, e.g. 'Harlington'
+    start_date (str): The first date fetched, e.g. '2022-01-01'
+    end_date (str): The date after the last date fetched
+    file_name (str): The station's CSV file the new rows are appended to, default is None to only update memory
+
+    Returns:
+    appended (int): The number of rows added"""
+
+    codes = catalogue.get_codes()
+
+    # The start of the station's last hour, in the API's timestamps
+    last_seen = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc) + datetime.timedelta(hours=int(station.hours[-1]) - 1)
+
+    readings = {}
+    for pollutant in station.values:
+        raw_data = monitoring.get_live_data_from_api(codes[station_name], codes[pollutant], start_date, end_date)
+        readings[pollutant] = monitoring.extract_new_readings(raw_data, last_seen)
+
+    appended = append_readings(station, readings, file_name)
+    return appended
+
+
+def get_statistics(station, pollutant):
+    """Returns the descriptive statistics of a pollutant, kept up to date as readings are appended
+
+    Parameters:
+    station (StationData): The station's data
+    pollutant (str): The pollutant
+
+    Returns:
+    statistics (dict): The same as utils.describe_values of the pollutant's values, up to floating point rounding"""
+
+    statistics = utils.get_statistics(station.statistics[pollutant])
+    return statistics
+
+
+def read_value(station, row, pollutant):
+    """Reads a single entry
+
+    Parameters:
+    station (StationData): The station's data
+    row (int): The index of the entry being read
+    pollutant (str): The pollutant being read
+
+    Returns:
+    value (float): The entry, NaN if it's missing"""
+
+    profiling.add_count("rows")
+
+    value = float(station.values[pollutant][row])
+    if station.decimals[pollutant] is not None:
+        value = round(value, station.decimals[pollutant])
+
+    return value
+
+
+def find_row(station, term, column):
+    """Finds the first row of a date, or of a time of day, using the sorted hours
+
+    Parameters:
+    station (StationData): The station's data
+    term (str): The date ('2021-01-01') or time ('01:00:00') being searched for
+    column (str): 'date' or 'time'
+
+    Returns:
+    row (int): The index of the first row with the term
+    -1: Returns -1 if the term cannot be found"""
+
+    if column == "date":
+        # A day's first reading is at 01:00:00
+        day = np.datetime64(term, "D").astype(np.int64)
+        row = int(np.searchsorted(station.hours, day * 24 + 1))
+
+        if row < len(station.hours) and (station.hours[row] - 1) // 24 == day:
+            return row
+        return -1
+
+    if column == "time":
+        matches = np.flatnonzero((station.hours - 1) % 24 + 1 == int(term[:2]))
+        return int(matches[0]) if len(matches) else -1
+
+    raise Exception("Invalid column passed")
+
+
+def memory_usage(station):
+    """Calculates the bytes used by a station's arrays
+
+    Parameters:
+    station (StationData): The station's data
+
+    Returns:
+    size (int): The number of bytes"""
+
+    size = station.hours.nbytes + sum(values.nbytes for values in station.values.values()) + \
+        sum(bitmap.nbytes for bitmap in station.missing.values())
+    return size
+
+
+# My functions
+
+def get_decimal_places(values, stored):
+    """Finds the fewest decimal places which recover every value exactly from its float32 copy
+
+    Parameters:
+    values (np.ndarray): The float64 values
+    stored (np.ndarray): The float32 copy
+
+    Returns:
+    decimals (int): The decimal places, None if float32 can't hold the values"""
+
+    for decimals in range(max_decimal_places + 1):
+        if is_recoverable(values, stored, decimals):
+            return decimals
+
+    return None
+
+
+def is_recoverable(values, stored, decimals):
+    """Checks if rounding the float32 copy of some values to a number of decimal places gives the values exactly
+
+    Parameters:
+    values (np.ndarray): The float64 values
+    stored (np.ndarray): The float32 copy
+    decimals (int): The decimal places
+
+    Returns:
+    recoverable (bool): Whether every value is recovered"""
+
+    present = ~np.isnan(values)
+    values = values[present]
+
+    recoverable = np.array_equal(np.round(values, decimals), values) and \
+        np.array_equal(np.round(stored[present].astype(np.float64), decimals), values)
+    return recoverable
+
+
+def validate_readings(station, readings):
+    """Checks new readings can be appended to a station and lines them up on one hourly axis
+
+    Parameters:
+    station (StationData): The station's data
+    readings (dict): (timestamp, value) tuples for any of the station's pollutants
+
+    Returns:
+    new_hours (np.ndarray): The int64 hours following the station's last hour up to the newest reading
+    new_values (dict): A float64 array of every pollutant's values for new_hours, missing data as NaN"""
+
+    last_hour = int(station.hours[-1]) if len(station.hours) else None
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+    pollutant_hours = {}
+
+    for pollutant, pollutant_readings in readings.items():
+        if pollutant not in station.values:
+            raise Exception(f"The station has no '{pollutant}' data")
+
+        hours = {}
+        for timestamp, value in pollutant_readings:
+            # Timestamps without a timezone are taken to be GMT, the same as the API's
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+            if timestamp.minute or timestamp.second or timestamp.microsecond:
+                raise Exception(f"Reading at {timestamp} isn't on the hour")
+
+            # Readings are timestamped at the start of their hour, rows at the end
+            hour = int((timestamp - epoch) // datetime.timedelta(hours=1)) + 1
+            if last_hour is not None and hour <= last_hour:
+                raise Exception(f"Reading at {timestamp} isn't after the station's last hour")
+            if hour in hours:
+                raise Exception(f"Reading at {timestamp} is repeated")
+
+            # NaN is allowed as missing data, some pollutants have small negative readings
+            value = float(value)
+            if value in (float("inf"), float("-inf")):
+                raise Exception(f"Reading at {timestamp} has an invalid value")
+            hours[hour] = value
+
+        pollutant_hours[pollutant] = hours
+
+    newest_hour = max((max(hours) for hours in pollutant_hours.values() if hours), default=None)
+    if newest_hour is None:
+        return np.empty(0, dtype=np.int64), {}
+
+    first_hour = last_hour + 1 if last_hour is not None else min(min(hours) for hours in pollutant_hours.values()
+                                                                  if hours)
+    new_hours = np.arange(first_hour, newest_hour + 1, dtype=np.int64)
+
+    # Pollutants without readings are missing for the new hours
+    new_values = {}
+    for pollutant in station.values:
+        values = np.full(len(new_hours), np.nan)
+        hours = pollutant_hours.get(pollutant, {})
+        if hours:
+            values[np.array(list(hours)) - first_hour] = list(hours.values())
+        new_values[pollutant] = values
+
+    return new_hours, new_values
+
+
+def append_to_csv(file_name, hours, values):
+    """Appends rows to a station's CSV file in its layout, with "No data" for missing values
+
+    Parameters:
+    file_name (str): The CSV file
+    hours (np.ndarray): The hour of every row
+    values (dict): The values of every pollutant, in the CSV's column order"""
+
+    # Making sure the new rows start on their own line, the CSV files don't end with a newline
+    needs_newline = False
+    if os.path.getsize(file_name):
+        with open(file_name, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+
+    days, day_hours = np.divmod(hours - 1, 24)
+    dates = days.astype("datetime64[D]").astype(str)
+    columns = [np.where(np.isnan(pollutant_values), "No data", pollutant_values.astype(str))
+               for pollutant_values in values.values()]
+
+    with open(file_name, 'a', newline='') as f:
+        if needs_newline:
+            f.write("\n")
+
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerows(zip(dates, (f"{hour:02}:00:00" for hour in (day_hours + 1).tolist()), *columns))
+
+    profiling.add_count("bytes_written", os.path.getsize(file_name))
@@ -1,12 +1,22 @@
-def sumvalues(values: [int]):
-    """Returns the sum of all the values in the list
+import numpy as np
+
+
+def sumvalues(values: [int], ignore_nan=False):
+    """Returns the sum of all the values in the list. NumPy arrays and other array-likes are summed in a single
+    vectorised pass
 
     Parameters:
     values (list): List of values to be summed
+    ignore_nan (bool): Leaves NaN values out of the sum of an array, default is False
 
     Returns:
     total (int): The sum of the values"""
 
+    if not isinstance(values, list):
+        values = as_numeric_array(values)
+        total = np.nansum(values) if ignore_nan else np.sum(values)
+        return total.item()
+
     if non_numericals_present(values):
         raise Exception("Non-numerical values are present in list")
 
@@ -17,15 +27,22 @@ def sumvalues(values: [int]):
     return total
 
 
-def maxvalue(values: [int]):
-    """Returns the index of the largest value out of a list of values using one pass of bubblesort
+def maxvalue(values: [int], ignore_nan=False):
+    """Returns the index of the largest value out of a list of values using one pass of bubblesort.
+    NumPy arrays and other array-likes are searched in a single vectorised pass
 
     Parameters:
     values (list): The list of values
+    ignore_nan (bool): Leaves NaN values out of the search of an array, default is False
 
     Returns:
     largest_element_index (int): The index of the largest value"""
 
+    if not isinstance(values, list):
+        values = as_numeric_array(values)
+        largest_element_index = np.nanargmax(values) if ignore_nan else np.argmax(values)
+        return int(largest_element_index)
+
     if non_numericals_present(values):
         raise Exception("Non-numerical values are present in list")
 
@@ -42,15 +59,22 @@ def maxvalue(values: [int]):
     return largest_element_index
 
 
-def minvalue(values: [int]):
-    """Returns the index of the smallest value out of a list of values using one pass of a bubblesort
+def minvalue(values: [int], ignore_nan=False):
+    """Returns the index of the smallest value out of a list of values using one pass of a bubblesort.
+    NumPy arrays and other array-likes are searched in a single vectorised pass
 
     Parameters:
     values (list): The list of values
+    ignore_nan (bool): Leaves NaN values out of the search of an array, default is False
 
     Returns:
     smallest_element_index (int): The index of the smallest value"""
 
+    if not isinstance(values, list):
+        values = as_numeric_array(values)
+        smallest_element_index = np.nanargmin(values) if ignore_nan else np.argmin(values)
+        return int(smallest_element_index)
+
     if non_numericals_present(values):
         raise Exception("Non-numerical values are present in list")
 
@@ -67,15 +91,28 @@ def minvalue(values: [int]):
     return smallest_element_index
 
 
-def meannvalue(values: [int]):
-    """Calculates the mean value of a list
+def meannvalue(values: [int], ignore_nan=False):
+    """Calculates the mean value of a list. NumPy arrays and other array-likes are averaged in a single
+    vectorised pass
 
     Parameters:
     values (list[int]): The list of values
+    ignore_nan (bool): Leaves NaN values out of the mean of an array, default is False
 
     Returns:
     average (float): The mean average value of the list"""
 
+    if not isinstance(values, list):
+        values = as_numeric_array(values)
+        length = np.count_nonzero(~np.isnan(values)) if ignore_nan and values.dtype.kind == "f" else values.size
+
+        if length == 0:
+            return -1
+
+        total = np.nansum(values) if ignore_nan else np.sum(values)
+        average = total.item() / length
+        return average
+
     if non_numericals_present(values):
         raise Exception("Non-numerical values are present in list")
 
@@ -94,7 +131,17 @@ def countvalue(values: [], x):
 
     Parameters:
     values (list): The list of values being searched
-    x: The term being searched for. Can be an int, string or float."""
+    x: The term being searched for. Can be an int, string or float.
+       If values is a NumPy array, passing NaN counts the NaN values"""
+
+    if not isinstance(values, list):
+        values = np.asarray(values)
+
+        if isinstance(x, float) and x != x and values.dtype.kind == "f":
+            return int(np.count_nonzero(np.isnan(values)))
+
+        count = int(np.count_nonzero(values == x))
+        return count
 
     count = 0
     for element in values:
@@ -104,6 +151,320 @@ def countvalue(values: [], x):
     return count
 
 
+def describe_values(values):
+    """Calculates all the descriptive statistics of a list or array in one pass, with NaN counted as missing data
+
+    Parameters:
+    values (list): The list or array of values
+
+    Returns:
+    statistics (dict): Contains the count, sum, mean, min, argmin, max, argmax, variance and missing count"""
+
+    accumulator = update_statistics(create_statistics(), values)
+    statistics = get_statistics(accumulator)
+    return statistics
+
+
+def create_statistics():
+    """Creates an empty accumulator for descriptive statistics which can be updated chunk by chunk
+
+    Returns:
+    accumulator (dict): Partial statistics for no values"""
+
+    accumulator = {
+        "length": 0,
+        "count": 0,
+        "missing": 0,
+        "sum": 0.0,
+        "mean": 0.0,
+        # Sum of squared differences from the mean, used for the variance
+        "m2": 0.0,
+        "min": float("inf"),
+        "argmin": -1,
+        "max": float("-inf"),
+        "argmax": -1
+    }
+
+    return accumulator
+
+
+def update_statistics(accumulator, chunk, offset=None):
+    """Adds a chunk of values to an accumulator of descriptive statistics
+
+    Parameters:
+    accumulator (dict): The accumulator from create_statistics, which isn't changed
+    chunk (list): The list or array of values being added
+    offset (int): The index of the chunk's first value in the whole series, default is None to follow on
+                  from the values already added
+
+    Returns:
+    accumulator (dict): A new accumulator including the chunk"""
+
+    chunk = as_numeric_array(chunk).astype(float, copy=False).ravel()
+    offset = accumulator["length"] if offset is None else offset
+
+    present = ~np.isnan(chunk)
+    count = int(np.count_nonzero(present))
+
+    chunk_statistics = create_statistics()
+    chunk_statistics["length"] = offset + chunk.size
+    chunk_statistics["missing"] = chunk.size - count
+
+    if count:
+        present_values = chunk[present]
+        present_indexes = np.nonzero(present)[0]
+
+        chunk_total = float(present_values.sum())
+        chunk_mean = chunk_total / count
+        min_index = int(present_values.argmin())
+        max_index = int(present_values.argmax())
+
+        chunk_statistics.update({
+            "count": count,
+            "sum": chunk_total,
+            "mean": chunk_mean,
+            "m2": float(np.square(present_values - chunk_mean).sum()),
+            "min": float(present_values[min_index]),
+            "argmin": offset + int(present_indexes[min_index]),
+            "max": float(present_values[max_index]),
+            "argmax": offset + int(present_indexes[max_index])
+        })
+
+    accumulator = merge_statistics(accumulator, chunk_statistics)
+    return accumulator
+
+
+def merge_statistics(first, second):
+    """Merges two accumulators of descriptive statistics, e.g. from workers reducing different chunks in parallel
+
+    Parameters:
+    first (dict): An accumulator from create_statistics or update_statistics
+    second (dict): Another accumulator
+
+    Returns:
+    merged (dict): An accumulator including the values of both"""
+
+    count = first["count"] + second["count"]
+    merged = create_statistics()
+    merged["length"] = max(first["length"], second["length"])
+    merged["missing"] = first["missing"] + second["missing"]
+
+    if count == 0:
+        return merged
+
+    # Combining the means and squared differences of both (Chan et al.)
+    delta = second["mean"] - first["mean"]
+    merged["count"] = count
+    merged["sum"] = first["sum"] + second["sum"]
+    merged["mean"] = first["mean"] + delta * second["count"] / count
+    merged["m2"] = first["m2"] + second["m2"] + delta ** 2 * first["count"] * second["count"] / count
+
+    # Ties are given to the earlier index, the same as maxvalue and minvalue
+    candidates = [statistics for statistics in (first, second) if statistics["count"]]
+    smallest = min(candidates, key=lambda x: (x["min"], x["argmin"]))
+    largest = max(candidates, key=lambda x: (x["max"], -x["argmax"]))
+
+    merged["min"], merged["argmin"] = smallest["min"], smallest["argmin"]
+    merged["max"], merged["argmax"] = largest["max"], largest["argmax"]
+
+    return merged
+
+
+def get_statistics(accumulator):
+    """Finishes an accumulator of descriptive statistics
+
+    Parameters:
+    accumulator (dict): An accumulator from create_statistics, update_statistics or merge_statistics
+
+    Returns:
+    statistics (dict): Contains the count, sum, mean, min, argmin, max, argmax, (population) variance
+                       and missing count. Values which need data are -1 if there wasn't any"""
+
+    count = accumulator["count"]
+
+    if count == 0:
+        statistics = {"count": 0, "sum": 0.0, "mean": -1, "min": -1, "argmin": -1, "max": -1, "argmax": -1,
+                      "variance": -1, "missing": accumulator["missing"]}
+        return statistics
+
+    statistics = {
+        "count": count,
+        "sum": accumulator["sum"],
+        "mean": accumulator["mean"],
+        "min": accumulator["min"],
+        "argmin": accumulator["argmin"],
+        "max": accumulator["max"],
+        "argmax": accumulator["argmax"],
+        "variance": accumulator["m2"] / count,
+        "missing": accumulator["missing"]
+    }
+
+    return statistics
+
+
+def exact_percentile(values, percentile):
+    """Finds a percentile of a list or array exactly using selection (np.partition) rather than a full sort,
+    with NaN counted as missing data
+
+    Parameters:
+    values (list): The list or array of values
+    percentile (float): The percentile being found, between 0 and 100, e.g. 50 for the median
+
+    Returns:
+    result (float): The percentile, linearly interpolated the same as np.percentile, or -1 if there's no data"""
+
+    values = as_numeric_array(values).astype(float).ravel()
+    values = values[~np.isnan(values)]
+
+    if values.size == 0:
+        return -1
+
+    rank = (values.size - 1) * percentile / 100
+    lower = int(rank)
+    upper = min(lower + 1, values.size - 1)
+
+    # Only the two ranks needed are put in their sorted positions
+    selected = np.partition(values, (lower, upper))
+    result = selected[lower] + (selected[upper] - selected[lower]) * (rank - lower)
+    return float(result)
+
+
+def create_digest(compression=100):
+    """Creates an empty t-digest, a sketch which approximates percentiles of any number of values using a
+    bounded number of centroids
+
+    Parameters:
+    compression (int): Roughly the number of centroids kept, higher is more accurate, default is 100
+
+    Returns:
+    digest (dict): A digest of no values"""
+
+    digest = {
+        "compression": compression,
+        "means": np.empty(0),
+        "weights": np.empty(0),
+        "count": 0,
+        "min": float("inf"),
+        "max": float("-inf")
+    }
+
+    return digest
+
+
+def update_digest(digest, values):
+    """Adds values to a t-digest, with NaN counted as missing data
+
+    Parameters:
+    digest (dict): The digest from create_digest, which isn't changed
+    values (list): The list or array of values being added
+
+    Returns:
+    digest (dict): A new digest including the values"""
+
+    values = as_numeric_array(values).astype(float).ravel()
+    values = values[~np.isnan(values)]
+
+    if values.size == 0:
+        return digest
+
+    chunk_digest = {
+        "compression": digest["compression"],
+        "means": values,
+        "weights": np.ones(values.size),
+        "count": values.size,
+        "min": float(values.min()),
+        "max": float(values.max())
+    }
+
+    digest = merge_digests(digest, chunk_digest)
+    return digest
+
+
+def merge_digests(first, second):
+    """Merges two t-digests, e.g. from different days or from workers digesting different chunks in parallel
+
+    Parameters:
+    first (dict): A digest from create_digest or update_digest
+    second (dict): Another digest
+
+    Returns:
+    merged (dict): A digest including the values of both"""
+
+    compression = max(first["compression"], second["compression"])
+    means = np.concatenate((first["means"], second["means"]))
+    weights = np.concatenate((first["weights"], second["weights"]))
+
+    order = np.argsort(means, kind="stable")
+    means = means[order].tolist()
+    weights = weights[order].tolist()
+    total = sum(weights)
+
+    merged = create_digest(compression)
+    merged["count"] = first["count"] + second["count"]
+    merged["min"] = min(first["min"], second["min"])
+    merged["max"] = max(first["max"], second["max"])
+
+    if not means:
+        return merged
+
+    # Neighbouring centroids are merged while the merged centroid stays within one unit of the k1 scale function,
+    # which keeps centroids small near the tails where percentiles like P98 need accuracy
+    new_means = []
+    new_weights = []
+    current_mean = means[0]
+    current_weight = weights[0]
+    weight_before = 0.0
+    weight_limit = total * digest_scale_inverse(digest_scale(0.0, compression) + 1, compression)
+
+    for mean, weight in zip(means[1:], weights[1:]):
+
+        if weight_before + current_weight + weight <= weight_limit:
+            current_weight += weight
+            current_mean += (mean - current_mean) * weight / current_weight
+            continue
+
+        new_means.append(current_mean)
+        new_weights.append(current_weight)
+        weight_before += current_weight
+        weight_limit = total * digest_scale_inverse(digest_scale(weight_before / total, compression) + 1,
+                                                    compression)
+        current_mean = mean
+        current_weight = weight
+
+    new_means.append(current_mean)
+    new_weights.append(current_weight)
+
+    merged["means"] = np.array(new_means)
+    merged["weights"] = np.array(new_weights)
+    return merged
+
+
+def digest_percentile(digest, percentile):
+    """Approximates a percentile from a t-digest
+
+    Parameters:
+    digest (dict): A digest from create_digest, update_digest or merge_digests
+    percentile (float): The percentile being found, between 0 and 100, e.g. 98
+
+    Returns:
+    result (float): The approximate percentile, or -1 if the digest has no values"""
+
+    if digest["count"] == 0:
+        return -1
+
+    means = digest["means"]
+    weights = digest["weights"]
+    total = weights.sum()
+
+    # Each centroid's mean is treated as sitting at the middle of its weight
+    centres = np.cumsum(weights) - weights / 2
+    positions = np.concatenate(([0.0], centres, [total]))
+    values = np.concatenate(([digest["min"]], means, [digest["max"]]))
+
+    result = float(np.interp(total * percentile / 100, positions, values))
+    return result
+
+
 # My functions
 
 def non_numericals_present(input_list: []):
@@ -128,6 +489,25 @@ def non_numericals_present(input_list: []):
     return False
 
 
+def as_numeric_array(values):
+    """Converts an array-like to a NumPy array, checking its values are numerical from its dtype rather than
+    checking every element
+
+    Parameters:
+    values: The NumPy array, pandas series, tuple or other array-like being converted
+
+    Returns:
+    values (np.ndarray): The values as a NumPy array"""
+
+    values = np.asarray(values)
+
+    # Integer, unsigned integer and float dtypes, matching the int and float check in non_numericals_present
+    if values.dtype.kind not in "iuf":
+        raise Exception("Non-numerical values are present in list")
+
+    return values
+
+
 def convert_list_type(input_list: [], target_type: str):
     """Converts the type of every element in a list
 
@@ -207,3 +587,31 @@ def get_length(structure):
         counter += 1
 
     return counter
+
+
+def digest_scale(q, compression):
+    """The k1 scale function of a t-digest, mapping a quantile to a scale where each centroid spans one unit
+
+    Parameters:
+    q (float): The quantile, between 0 and 1
+    compression (int): The compression of the digest
+
+    Returns:
+    k (float): The position on the scale"""
+
+    k = compression / (2 * np.pi) * np.arcsin(2 * min(max(q, 0.0), 1.0) - 1)
+    return k
+
+
+def digest_scale_inverse(k, compression):
+    """The inverse of digest_scale
+
+    Parameters:
+    k (float): The position on the scale
+    compression (int): The compression of the digest
+
+    Returns:
+    q (float): The quantile, between 0 and 1"""
+
+    q = (np.sin(min(max(k * 2 * np.pi / compression, -np.pi / 2), np.pi / 2)) + 1) / 2
+    return q